@@ -1,10 +1,11 @@
 
 const Recommendation = require('../models/recommendation.model');
 const User = require('../models/user.model');
+const Mood = require('../models/mood.model');
 const { asyncHandler, AppError } = require('../middleware/error.middleware');
 const { getSpotifyRecommendations } = require('../utils/spotifyAPI');
 const { getYouTubeRecommendations } = require('../utils/youtubeAPI');
-const { getAIRecommendations } = require('../utils/aiServiceConnector');
+const { getAIRecommendations, recordAICompletions } = require('../utils/aiServiceConnector');
 
 /**
  * @desc    Get recommendations for user
@@ -26,14 +27,16 @@ exports.getRecommendations = asyncHandler(async (req, res) => {
     try {
       // First try to get recommendations from the AI service
       const userId = req.user._id.toString();
-      const previousRecommendationIds = recommendations.map(rec => rec._id.toString());
+      
+      // The latest entry's text lets the AI service rank items by relevance
+      const latestMood = await Mood.findOne({ userId }).sort({ date: -1 }).select('transcription');
       
       try {
-        // Get AI-powered personalized recommendations
+        // Get AI-powered personalized recommendations (the AI service tracks what each user has seen)
         const aiRecommendations = await getAIRecommendations(
           userId, 
           moodLabel, 
-          previousRecommendationIds
+          latestMood ? latestMood.transcription : undefined
         );
         
         // Save these recommendations to database
@@ -47,7 +50,8 @@ exports.getRecommendations = asyncHandler(async (req, res) => {
             imageUrl: rec.imageUrl,
             forMoods: rec.forMoods || [moodLabel],
             tags: rec.tags || [],
-            duration: rec.duration
+            duration: rec.duration,
+            sourceId: rec.id
           }));
           
           await Recommendation.insertMany(formattedRecs);
@@ -138,6 +142,13 @@ exports.markCompleted = asyncHandler(async (req, res) => {
     const user = await User.findById(userId);
     user.tokens += 5;
     await user.save();
+    
+    // Completed items are not recommended again by the AI service
+    if (recommendation.sourceId) {
+      recordAICompletions(userId.toString(), [recommendation.sourceId]).catch(error => {
+        console.error('Error recording completion with AI service:', error.message);
+      });
+    }
   }
   
   res.status(200).json({
@@ -34,6 +34,10 @@ const recommendationSchema = new mongoose.Schema({
   duration: {
     type: String
   },
+  // ID of the item in the AI service, which keeps per-user recommendation history
+  sourceId: {
+    type: String
+  },
   // For user-specific recommendation tracking
   userCompletions: [{
     userId: {
@@ -44,15 +44,16 @@ exports.analyzeSentimentWithAI = async (audioBuffer) => {
  * Get personalized recommendations from the AI service
  * @param {string} userId - User ID
  * @param {string} moodLabel - Mood label
- * @param {Array<string>} previousRecommendations - IDs of previously given recommendations
+ * @param {string} latestEntry - Text of the user's latest entry, used to rank recommendations
  * @returns {Promise<Array>} - List of recommendations
  */
-exports.getAIRecommendations = async (userId, moodLabel, previousRecommendations = []) => {
+exports.getAIRecommendations = async (userId, moodLabel, latestEntry) => {
   try {
+    // Previously served items are tracked by the AI service, so they are not sent
     const response = await axios.post(`${AI_SERVICE_URL}/get-recommendations`, {
       userId,
       moodLabel,
-      previousRecommendations
+      latestEntry
     });
 
     return response.data.recommendations || [];
@@ -62,6 +63,20 @@ exports.getAIRecommendations = async (userId, moodLabel, previousRecommendations
   }
 };
 
+/**
+ * Tell the AI service that a user completed recommendations
+ * @param {string} userId - User ID
+ * @param {Array<string>} recommendationIds - AI service IDs of the completed recommendations
+ * @returns {Promise<Object>} - Number of recorded items
+ */
+exports.recordAICompletions = async (userId, recommendationIds) => {
+  const response = await axios.post(`${AI_SERVICE_URL}/recommendation-history`, {
+    userId,
+    completedRecommendations: recommendationIds
+  });
+  return response.data;
+};
+
 /**
  * Generate a wellness report PDF using the AI service
  * @param {Object} reportData - Report data including mood entries, etc.
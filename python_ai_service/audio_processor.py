@@ -1,117 +1,433 @@
 
 import os
 import io
+import subprocess
+import requests
 import librosa
 import numpy as np
 import soundfile as sf
-import tempfile
-import openai
+from functools import cached_property
 from dotenv import load_dotenv
+from result_cache import ResultCache, content_hash
+from transcriber import TranscriptionError, get_transcriber, transcription_version
+from vad import VAD_ENABLED, detect_speech, vad_version
 
 # Load environment variables
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def process_audio(audio_data):
+# Timeout and size limit when fetching referenced audio files
+AUDIO_FETCH_TIMEOUT = float(os.getenv("AUDIO_FETCH_TIMEOUT", 10))
+AUDIO_FETCH_MAX_BYTES = int(os.getenv("AUDIO_FETCH_MAX_BYTES", 25 * 1024 * 1024))
+
+# Sample rate every clip is decoded to before feature extraction (16000 suits speech-only setups)
+TARGET_SAMPLE_RATE = int(os.getenv("AUDIO_SAMPLE_RATE", 22050))
+# librosa resampler: soxr_hq (librosa's default), soxr_mq, soxr_lq or polyphase
+AUDIO_RESAMPLE_TYPE = os.getenv("AUDIO_RESAMPLE_TYPE", "soxr_hq")
+# ffmpeg binary for containers libsndfile cannot read (WebM, MP4/M4A)
+AUDIO_FFMPEG_PATH = os.getenv("AUDIO_FFMPEG_PATH", "ffmpeg")
+AUDIO_DECODE_TIMEOUT = float(os.getenv("AUDIO_DECODE_TIMEOUT", 30))
+
+# Leading bytes of the containers we accept -> format name
+AUDIO_MAGIC_BYTES = [
+    (0, b"RIFF", "wav"),
+    (0, b"RF64", "wav"),
+    (0, b"fLaC", "flac"),
+    (0, b"OggS", "ogg"),
+    (0, b"ID3", "mp3"),
+    (0, b"FORM", "aiff"),
+    (0, b"\x1aE\xdf\xa3", "webm"),
+    (4, b"ftyp", "mp4")
+]
+# Formats decoded in-process by libsndfile; the rest go through an ffmpeg pipe
+SOUNDFILE_FORMATS = {"wav", "flac", "ogg", "mp3", "aiff"}
+
+# STFT parameters shared by every spectral feature (librosa defaults)
+N_FFT = 2048
+HOP_LENGTH = 512
+
+class SharedSpectrogram:
+    """
+    Lazily computed spectral representations of a single clip
+
+    The complex STFT is computed at most once and the magnitude, power,
+    mel power and mel dB spectrograms are all derived from it, so every
+    feature extractor reads from the same arrays.
+    """
+
+    def __init__(self, y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, center=True):
+        self.y = y
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.center = center
+
+    @cached_property
+    def stft(self):
+        return librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length, center=self.center)
+
+    @cached_property
+    def magnitude(self):
+        return np.abs(self.stft)
+
+    @cached_property
+    def power(self):
+        return self.magnitude ** 2
+
+    @cached_property
+    def mel_power(self):
+        return librosa.feature.melspectrogram(S=self.power, sr=self.sr, n_fft=self.n_fft,
+                                              hop_length=self.hop_length)
+
+    @cached_property
+    def mel_db(self):
+        return librosa.power_to_db(self.mel_power)
+
+    @cached_property
+    def frame_rms(self):
+        # Time-domain RMS per STFT frame, shared by the RMS feature and the fast tempo estimate
+        return librosa.feature.rms(y=self.y, hop_length=self.hop_length)
+
+    @cached_property
+    def harmonic(self):
+        # Same result as librosa.effects.harmonic(y), without a second STFT
+        harmonic_stft, _ = librosa.decompose.hpss(self.stft)
+        return librosa.istft(harmonic_stft, hop_length=self.hop_length, length=len(self.y))
+
+def _frame_mean(feature):
+    return np.mean(feature.T, axis=0).tolist()
+
+def _extract_mfccs(spec):
+    # 1. MFCCs (Mel-Frequency Cepstral Coefficients)
+    return _frame_mean(librosa.feature.mfcc(S=spec.mel_db, sr=spec.sr, n_mfcc=13))
+
+def _extract_chroma(spec):
+    # 2. Chroma features
+    return _frame_mean(librosa.feature.chroma_stft(S=spec.power, sr=spec.sr, n_fft=spec.n_fft,
+                                                   hop_length=spec.hop_length))
+
+def _extract_mel(spec):
+    # 3. Mel-scaled spectrogram
+    return _frame_mean(spec.mel_db)
+
+def _extract_contrast(spec):
+    # 4. Spectral Contrast
+    return _frame_mean(librosa.feature.spectral_contrast(S=spec.magnitude, sr=spec.sr, n_fft=spec.n_fft,
+                                                         hop_length=spec.hop_length))
+
+def _extract_tonnetz(spec):
+    # 5. Tonnetz (tonal centroid features), computed on the CQT of the harmonic part
+    return _frame_mean(librosa.feature.tonnetz(y=spec.harmonic, sr=spec.sr))
+
+def _extract_zcr(spec):
+    # 6. Zero Crossing Rate (time domain, no spectrogram needed)
+    return _frame_mean(librosa.feature.zero_crossing_rate(spec.y, hop_length=spec.hop_length))
+
+def _extract_tempo(spec):
+    # 7. Tempo, tracked on an onset envelope derived from the shared mel spectrogram
+    onset_envelope = librosa.onset.onset_strength(S=spec.mel_db, sr=spec.sr, aggregate=np.median)
+    tempo, _ = librosa.beat.beat_track(onset_envelope=onset_envelope, sr=spec.sr,
+                                       hop_length=spec.hop_length)
+    return float(np.atleast_1d(tempo)[0])
+
+def _extract_rms(spec):
+    # 8. RMS Energy, framed in the time domain so its scale matches what the scorer expects
+    return _frame_mean(spec.frame_rms)
+
+def _extract_tempo_fast(spec):
+    # Tempo from a log-energy onset envelope: no STFT and no beat tracking pass.
+    # beat_track reports this same autocorrelation estimate, only fed from the mel spectrogram.
+    log_energy = np.log1p(100 * spec.frame_rms[0])
+    onset_envelope = np.maximum(0.0, np.diff(log_energy, prepend=log_energy[:1]))
+    if not onset_envelope.any():
+        return 0.0
+    tempo = librosa.feature.tempo(onset_envelope=onset_envelope, sr=spec.sr, hop_length=spec.hop_length)
+    return float(np.atleast_1d(tempo)[0])
+
+# Feature name -> extractor reading from a SharedSpectrogram
+FEATURE_EXTRACTORS = {
+    "mfccs": _extract_mfccs,
+    "chroma": _extract_chroma,
+    "mel": _extract_mel,
+    "contrast": _extract_contrast,
+    "tonnetz": _extract_tonnetz,
+    "zcr": _extract_zcr,
+    "tempo": _extract_tempo,
+    "rms": _extract_rms
+}
+
+FEATURE_NAMES = list(FEATURE_EXTRACTORS)
+
+# Named feature profiles: "full" keeps the rich vector for research, "fast" computes
+# only what the sentiment scorer reads (rms and tempo) with a cheap tempo estimate
+FEATURE_PROFILES = {
+    "full": FEATURE_EXTRACTORS,
+    "fast": {
+        "rms": _extract_rms,
+        "tempo": _extract_tempo_fast
+    }
+}
+
+# Profile used when a request does not pick one
+FEATURE_PROFILE = os.getenv("FEATURE_PROFILE", "full")
+
+def get_feature_profile(profile=None):
+    """Extractor table of the given (or configured) profile"""
+    profile = profile or FEATURE_PROFILE
+    if profile not in FEATURE_PROFILES:
+        raise ValueError(f"Unknown feature profile: {profile}")
+    return FEATURE_PROFILES[profile]
+
+def extract_features(y, sr, features=None, profile=None):
+    """
+    Extract the requested audio features from a decoded signal
+    
+    Parameters:
+    y (np.ndarray): Mono audio samples
+    sr (int): Sample rate of y
+    features (list): Names of the features to compute, defaults to every feature of the profile
+    profile (str): Feature profile ("full" or "fast"), defaults to FEATURE_PROFILE
+    
+    Returns:
+    dict: Feature name -> mean value over frames
+    """
+    extractors = get_feature_profile(profile)
+    if features is None:
+        features = list(extractors)
+    
+    unknown = [name for name in features if name not in extractors]
+    if unknown:
+        raise ValueError(f"Unknown audio features: {', '.join(unknown)}")
+    
+    spec = SharedSpectrogram(y, sr)
+    return {name: extractors[name](spec) for name in features}
+
+class DecodedAudio:
+    """
+    An upload decoded once into memory
+
+    Holds the mono float32 samples used by feature extraction together with
+    the original encoded bytes, so transcription backends can reuse either
+    without touching the disk.
+    """
+
+    def __init__(self, samples, sr, raw_bytes=None, format=None):
+        self.samples = samples
+        self.sr = sr
+        self.raw_bytes = raw_bytes
+        self.format = format
+
+    @property
+    def duration(self):
+        return len(self.samples) / float(self.sr)
+
+    @cached_property
+    def content_hash(self):
+        """Hash of the original upload (or of the samples if there is none)"""
+        if self.raw_bytes is not None:
+            return content_hash(self.raw_bytes)
+        return content_hash(self.samples.tobytes() + str(self.sr).encode())
+
+    @cached_property
+    def speech(self):
+        """Speech segments found by voice activity detection, computed once"""
+        return detect_speech(self.samples, self.sr)
+
+    def voiced(self):
+        """
+        The speech regions only, as a new DecodedAudio
+
+        Returns self when VAD is disabled, finds no speech (so quiet recordings
+        are still analyzed whole) or finds nothing to trim.
+        """
+        if not VAD_ENABLED or not self.speech.has_speech or self.speech.speech_samples == len(self.samples):
+            return self
+        return DecodedAudio(self.speech.voiced(self.samples), self.sr)
+
+    def to_wav_bytes(self):
+        """Encode the decoded samples as an in-memory WAV file"""
+        buffer = io.BytesIO()
+        sf.write(buffer, self.samples, self.sr, format="WAV")
+        return buffer.getvalue()
+
+    def as_upload(self, filename=None):
+        """(filename, bytes) tuple accepted by HTTP upload clients, named after the actual format"""
+        if self.raw_bytes is not None:
+            return (filename or f"audio.{self.format or 'wav'}", self.raw_bytes)
+        return (filename or "audio.wav", self.to_wav_bytes())
+
+def probe_audio_format(audio_data):
+    """
+    Container format of encoded audio, from its leading bytes
+    
+    Returns:
+    str: "wav", "flac", "ogg" (Vorbis or Opus), "mp3", "aiff", "webm", "mp4", or None if unknown
+    """
+    for offset, magic, name in AUDIO_MAGIC_BYTES:
+        if audio_data[offset:offset + len(magic)] == magic:
+            return name
+    # Bare MPEG audio frame sync
+    if len(audio_data) > 1 and audio_data[0] == 0xFF and audio_data[1] & 0xE0 == 0xE0:
+        return "mp3"
+    return None
+
+def _decode_with_ffmpeg(audio_data, sr):
+    """Decode through an ffmpeg pipe straight to mono float32 at sr, without temp files"""
+    try:
+        result = subprocess.run(
+            [AUDIO_FFMPEG_PATH, "-nostdin", "-hide_banner", "-loglevel", "error",
+             "-i", "pipe:0", "-f", "f32le", "-ac", "1", "-ar", str(sr), "pipe:1"],
+            input=audio_data, capture_output=True, timeout=AUDIO_DECODE_TIMEOUT, check=True
+        )
+    except FileNotFoundError:
+        raise ValueError("Decoding this audio format requires ffmpeg")
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"ffmpeg could not decode the audio: {e.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32).copy()
+
+def _decode_with_soundfile(audio_data, sr):
+    samples, native_sr = sf.read(io.BytesIO(audio_data), dtype="float32", always_2d=True)
+    
+    # Down-mix to mono the same way librosa.load does
+    samples = samples[:, 0] if samples.shape[1] == 1 else np.mean(samples, axis=1)
+    
+    # Clips already at the target rate skip resampling entirely
+    if native_sr != sr:
+        samples = librosa.resample(samples, orig_sr=native_sr, target_sr=sr, res_type=AUDIO_RESAMPLE_TYPE)
+    return samples
+
+def decode_audio(audio_data, sr=TARGET_SAMPLE_RATE):
+    """
+    Decode raw audio bytes into memory without writing temporary files
+    
+    WAV, FLAC, Ogg (Vorbis/Opus), MP3 and AIFF are read by libsndfile at their
+    native rate and resampled once; WebM and MP4 are decoded and resampled by
+    an ffmpeg pipe.
+    
+    Parameters:
+    audio_data (bytes or DecodedAudio): Raw audio data, returned as is if already decoded
+    sr (int): Sample rate to resample to
+    
+    Returns:
+    DecodedAudio: Mono float32 samples at sr plus the original bytes
+    """
+    if isinstance(audio_data, DecodedAudio):
+        return audio_data
+    
+    audio_format = probe_audio_format(audio_data)
+    if audio_format in SOUNDFILE_FORMATS:
+        samples = _decode_with_soundfile(audio_data, sr)
+    elif audio_format is not None:
+        samples = _decode_with_ffmpeg(audio_data, sr)
+    else:
+        # Unknown header: let libsndfile try, then ffmpeg
+        try:
+            samples = _decode_with_soundfile(audio_data, sr)
+        except RuntimeError:
+            samples = _decode_with_ffmpeg(audio_data, sr)
+    
+    decoded = DecodedAudio(samples, sr, raw_bytes=audio_data, format=audio_format)
+    if VAD_ENABLED:
+        # Run VAD once here; the segments travel with the decoded audio to
+        # feature extraction and transcription
+        decoded.speech
+    return decoded
+
+# Feature values depend on the decode rate, the STFT setup and the librosa version
+FEATURE_VERSION = f"{TARGET_SAMPLE_RATE}|{AUDIO_RESAMPLE_TYPE}|{N_FFT}|{HOP_LENGTH}|librosa-{librosa.__version__}|{vad_version()}"
+
+# Results keyed by a hash of the audio bytes, so retries and replays skip the work
+audio_feature_cache = ResultCache("audio_features", FEATURE_VERSION)
+transcription_cache = ResultCache("transcription", f"{transcription_version()}|{vad_version()}")
+
+def _audio_hash(audio_data):
+    if isinstance(audio_data, DecodedAudio):
+        return audio_data.content_hash
+    return content_hash(audio_data)
+
+def fetch_audio(audio_url):
+    """
+    Download a referenced audio file into memory
+    
+    Parameters:
+    audio_url (str): HTTP(S) URL of the audio file
+    
+    Returns:
+    bytes: Raw audio data
+    """
+    if not audio_url.startswith(("http://", "https://")):
+        raise ValueError("Only http(s) audio URLs are supported")
+    
+    with requests.get(audio_url, timeout=AUDIO_FETCH_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        buffer = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            buffer.write(chunk)
+            if buffer.tell() > AUDIO_FETCH_MAX_BYTES:
+                raise ValueError("Audio file is too large")
+        return buffer.getvalue()
+
+def process_audio(audio_data, features=None, profile=None):
     """
     Process audio data to extract features useful for sentiment analysis
     
     Parameters:
-    audio_data (bytes): Raw audio data
+    audio_data (bytes or DecodedAudio): Raw or already decoded audio data
+    features (list): Names of the features to compute, defaults to every feature of the profile
+    profile (str): Feature profile ("full" or "fast"), defaults to FEATURE_PROFILE
     
     Returns:
-    dict: Audio features including mfccs, chroma, mel, contrast, tonnetz
+    dict: Audio features including mfccs, chroma, mel, contrast, tonnetz, computed on the
+          speech regions only, plus speech ratio and pause statistics when VAD is enabled
     """
     try:
-        # Save audio data to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
-            temp_audio.write(audio_data)
-            temp_audio_path = temp_audio.name
-        
-        # Load audio file with librosa
-        y, sr = librosa.load(temp_audio_path, sr=22050)
-        
-        # Remove temporary file
-        os.unlink(temp_audio_path)
-        
-        # Extract audio features
-        
-        # 1. MFCCs (Mel-Frequency Cepstral Coefficients)
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        mfccs_mean = np.mean(mfccs.T, axis=0).tolist()
-        
-        # 2. Chroma features
-        chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-        chroma_mean = np.mean(chroma.T, axis=0).tolist()
-        
-        # 3. Mel-scaled spectrogram
-        mel = librosa.feature.melspectrogram(y=y, sr=sr)
-        mel_mean = np.mean(librosa.power_to_db(mel).T, axis=0).tolist()
-        
-        # 4. Spectral Contrast
-        contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-        contrast_mean = np.mean(contrast.T, axis=0).tolist()
+        profile = profile or FEATURE_PROFILE
+        cache_key = audio_feature_cache.make_key(_audio_hash(audio_data), profile,
+                                                 ",".join(features or get_feature_profile(profile)))
+        cached = audio_feature_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        # 5. Tonnetz (tonal centroid features)
-        tonnetz = librosa.feature.tonnetz(y=librosa.effects.harmonic(y), sr=sr)
-        tonnetz_mean = np.mean(tonnetz.T, axis=0).tolist()
-        
-        # 6. Zero Crossing Rate
-        zcr = librosa.feature.zero_crossing_rate(y)
-        zcr_mean = np.mean(zcr.T, axis=0).tolist()
-        
-        # 7. Tempo and beat strength
-        tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
-        
-        # 8. RMS Energy
-        rms = librosa.feature.rms(y=y)
-        rms_mean = np.mean(rms.T, axis=0).tolist()
-        
-        # Combine features
-        features = {
-            "mfccs": mfccs_mean,
-            "chroma": chroma_mean,
-            "mel": mel_mean,
-            "contrast": contrast_mean,
-            "tonnetz": tonnetz_mean,
-            "zcr": zcr_mean,
-            "tempo": float(tempo),
-            "rms": rms_mean
-        }
-        
-        return features
+        audio = decode_audio(audio_data)
+        voiced = audio.voiced()
+        result = extract_features(voiced.samples, voiced.sr, features, profile)
+        if VAD_ENABLED:
+            result.update(audio.speech.stats())
+        audio_feature_cache.set(cache_key, result)
+        return result
     except Exception as e:
         print(f"Error in audio processing: {str(e)}")
         return None
 
 def transcribe_audio(audio_data):
     """
-    Transcribe audio data to text using OpenAI Whisper
+    Transcribe audio data to text with the configured transcription backend
     
     Parameters:
-    audio_data (bytes): Raw audio data
+    audio_data (bytes or DecodedAudio): Raw or already decoded audio data
     
     Returns:
     str: Transcribed text
+    
+    Raises:
+    TranscriptionError: If the backend could not transcribe the audio
     """
+    cache_key = transcription_cache.make_key(_audio_hash(audio_data))
+    cached = transcription_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        # Save audio data to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
-            temp_audio.write(audio_data)
-            temp_audio_path = temp_audio.name
-        
-        # Use OpenAI's Whisper API via client API
-        with open(temp_audio_path, "rb") as audio_file:
-            transcription = openai.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="en"
-            )
-        
-        # Remove temporary file
-        os.unlink(temp_audio_path)
-        
-        return transcription.text
+        # Silence is skipped, so it is neither uploaded nor decoded
+        audio = decode_audio(audio_data).voiced()
+        result = get_transcriber().transcribe(audio)
+    except TranscriptionError as e:
+        print(f"Error in transcription: {str(e)}")
+        raise
     except Exception as e:
         print(f"Error in transcription: {str(e)}")
-        return "Error in transcription"
+        raise TranscriptionError(str(e))
+    
+    print(f"Transcribed {result.audio_seconds:.1f}s of audio with {result.backend} "
+          f"in {result.processing_seconds:.2f}s (RTF {result.real_time_factor:.2f})")
+    transcription_cache.set(cache_key, result.text)
+    return result.text
@@ -0,0 +1,93 @@
+import os
+import asyncio
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Largest number of items sent to a model in one call
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 16))
+# How long the first item of a batch waits for others to join it
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 10))
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent requests into small batches
+
+    A batch is dispatched when it reaches max_batch_size or when its first
+    item has waited max_wait_ms, whichever comes first. batch_fn is an async
+    callable taking a list of items and returning one result per item, in
+    the same order; each caller gets back its own result (or the batch's
+    exception).
+    """
+
+    def __init__(self, batch_fn, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._timer = None
+        self._running = set()
+
+    async def submit(self, item):
+        """Queue one item and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch = self._pending[:self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size:]
+
+        # Leftovers start a new wait window
+        if self._pending:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            # Keep a reference so the task is not garbage collected mid-flight
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        error = None
+        try:
+            results = await self.batch_fn([item for item, _ in batch])
+            for (_, future), result in zip(batch, results):
+                # The caller may have gone away (e.g. client disconnect)
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            error = e
+        except BaseException:
+            # Cancelled, e.g. at shutdown
+            error = RuntimeError("Batch was cancelled")
+            raise
+        finally:
+            # No caller is left waiting forever, whatever happened to the batch
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error or RuntimeError("Batch returned too few results"))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avgBatchSize": self.items / self.batches if self.batches else 0.0
+        }
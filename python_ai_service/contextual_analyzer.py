@@ -0,0 +1,272 @@
+import os
+import json
+import openai
+from dotenv import load_dotenv
+from model_registry import registry
+
+# Load environment variables
+load_dotenv()
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# Which contextual analyzer this deployment uses: "openai", "local" or "none"
+CONTEXTUAL_ANALYZER = os.getenv("CONTEXTUAL_ANALYZER", "openai")
+# Analyzer answering when the OpenAI call fails (e.g. offline): "none" (neutral, as before) or "local" (opt-in)
+CONTEXTUAL_ANALYZER_FALLBACK = os.getenv("CONTEXTUAL_ANALYZER_FALLBACK", "none")
+
+# System prompt for the GPT-4 contextual analysis step
+CONTEXT_ANALYSIS_PROMPT = """You are an expert in mental health analysis for Indian individuals.
+                        Analyze the sentiment and emotional state from this text, considering Indian cultural context.
+                        Consider family dynamics, social pressures, spiritual practices, and work culture in India.
+
+                        Return ONLY a JSON object with the following structure:
+                        {
+                          "context_analysis": "Brief analysis of the person's emotional state",
+                          "sentiment_score_adjustment": Value between -0.3 and 0.3 to adjust the sentiment score,
+                          "detected_emotions": {
+                            "emotion1": probability from 0 to 1,
+                            "emotion2": probability from 0 to 1,
+                            ...
+                          },
+                          "cultural_factors": ["List of identified cultural factors affecting mood"],
+                          "severity_level": "normal" or "concerning" or "urgent"
+                        }"""
+
+def neutral_context_analysis():
+    return {
+        "sentiment_score_adjustment": 0,
+        "detected_emotions": {},
+        "cultural_factors": [],
+        "severity_level": "normal"
+    }
+
+class NoContextualAnalyzer:
+    """Skips contextual analysis; every text gets a neutral result"""
+
+    name = "none"
+
+    def analyze(self, transcription, cultural_factors=None):
+        return neutral_context_analysis()
+
+    async def analyze_async(self, transcription, cultural_factors=None):
+        return self.analyze(transcription, cultural_factors)
+
+# Emotion cues in English, Hindi and Hinglish for the local analyzer
+EMOTION_LEXICON = {
+    "sadness": [
+        "sad", "unhappy", "lonely", "alone", "crying", "cried", "heartbroken", "miss",
+        "depressed", "empty", "low", "down", "upset", "udaas", "dukhi", "akela", "akeli",
+        "उदास", "दुखी", "अकेला", "अकेली"
+    ],
+    "fear": [
+        "anxious", "anxiety", "worried", "worry", "scared", "afraid", "nervous", "panic",
+        "tension", "tense", "overwhelmed", "stressed", "stress", "pressure", "dar", "ghabrahat",
+        "डर", "घबराहट", "चिंता", "तनाव"
+    ],
+    "anger": [
+        "angry", "frustrated", "irritated", "annoyed", "furious", "hate", "fed up",
+        "gussa", "naraz", "गुस्सा", "नाराज़"
+    ],
+    "disgust": ["disgusted", "disgusting", "sick of", "gross"],
+    "joy": [
+        "happy", "glad", "excited", "grateful", "thankful", "proud", "great", "wonderful",
+        "amazing", "enjoyed", "fun", "khush", "maza", "mazaa", "खुश", "आनंद"
+    ],
+    "optimism": [
+        "hopeful", "looking forward", "better", "motivated", "confident", "improving",
+        "umeed", "उम्मीद"
+    ],
+    "love": ["love", "loved", "caring", "cared for", "pyaar", "प्यार"],
+    "neutral": ["okay", "fine", "normal day", "theek", "ठीक"]
+}
+
+POSITIVE_EMOTIONS = {"joy", "optimism", "love"}
+NEGATIVE_EMOTIONS = {"sadness", "fear", "anger", "disgust"}
+
+# Phrases that escalate severity. Negation is ignored for these on purpose.
+SEVERITY_LEXICON = {
+    "urgent": [
+        "suicide", "suicidal", "kill myself", "end my life", "want to die", "better off dead",
+        "no reason to live", "self harm", "hurt myself", "cut myself", "marna chahta",
+        "marna chahti", "jeena nahi chahta", "jeena nahi chahti", "आत्महत्या", "मरना चाहता", "मरना चाहती"
+    ],
+    "concerning": [
+        "hopeless", "worthless", "can't go on", "cannot go on", "give up", "nobody cares",
+        "a burden", "can't sleep", "cannot sleep", "not eating", "breakdown", "numb",
+        "no one to talk", "trapped", "bekaar", "बेकार", "निराश"
+    ]
+}
+
+NEGATIONS = {"not", "no", "never", "don't", "dont", "didn't", "didnt", "isn't", "isnt",
+             "wasn't", "wasnt", "nahi", "nahin", "mat", "नहीं"}
+
+# Readable names for the cultural context types reported as cultural factors
+CULTURAL_FACTOR_NAMES = {
+    "family_terms": "family dynamics",
+    "social_pressure_terms": "social pressure",
+    "spiritual_terms": "spiritual practice",
+    "work_culture_terms": "work culture"
+}
+
+def _load_context_lexicon():
+    from phrase_matcher import KeywordAutomaton
+
+    matcher = KeywordAutomaton()
+    for emotion, terms in EMOTION_LEXICON.items():
+        for term in terms:
+            matcher.add(term, ("emotion", emotion))
+    for severity, terms in SEVERITY_LEXICON.items():
+        for term in terms:
+            matcher.add(term, ("severity", severity))
+    matcher.build()
+    return matcher
+
+registry.register("context_lexicon", _load_context_lexicon)
+
+def _is_negated(text, start):
+    # Look at the two words right before the match
+    preceding = text[max(0, start - 24):start].lower().split()[-2:]
+    return any(word.strip(".,!?;:") in NEGATIONS for word in preceding)
+
+class LocalContextualAnalyzer:
+    """
+    Rule-based contextual analysis that runs on the local CPU
+
+    Scans the text once with a multilingual cue lexicon and returns the
+    same JSON contract as the GPT-4 analysis, so it can replace it offline
+    or where the network round trip is too slow.
+    """
+
+    name = "local"
+
+    def analyze(self, transcription, cultural_factors=None):
+        emotion_counts = {}
+        severity = "normal"
+
+        for start, _, _, (kind, value) in registry.get("context_lexicon").find(transcription):
+            if kind == "severity":
+                if value == "urgent" or severity == "normal":
+                    severity = value
+            elif not _is_negated(transcription, start):
+                emotion_counts[value] = emotion_counts.get(value, 0) + 1
+
+        total = sum(emotion_counts.values())
+        detected_emotions = {
+            emotion: round(count / total, 2)
+            for emotion, count in sorted(emotion_counts.items(), key=lambda item: -item[1])
+        }
+
+        # Lean the score towards the balance of positive and negative cues,
+        # with more cues giving a stronger (but bounded) adjustment
+        positive = sum(count for emotion, count in emotion_counts.items() if emotion in POSITIVE_EMOTIONS)
+        negative = sum(count for emotion, count in emotion_counts.items() if emotion in NEGATIVE_EMOTIONS)
+        adjustment = 0
+        if positive + negative:
+            balance = (positive - negative) / (positive + negative)
+            adjustment = round(0.3 * balance * min(1.0, (positive + negative) / 3), 3)
+        if severity != "normal":
+            adjustment = min(adjustment, -0.2)
+
+        return {
+            "sentiment_score_adjustment": adjustment,
+            "detected_emotions": detected_emotions,
+            "cultural_factors": [
+                f"{CULTURAL_FACTOR_NAMES.get(context_type, context_type)}: {', '.join(terms)}"
+                for context_type, terms in (cultural_factors or {}).items()
+            ],
+            "severity_level": severity
+        }
+
+    async def analyze_async(self, transcription, cultural_factors=None):
+        return self.analyze(transcription, cultural_factors)
+
+class OpenAIContextualAnalyzer:
+    """GPT-4 contextual analysis through the OpenAI API"""
+
+    name = "openai"
+
+    def __init__(self, model="gpt-4"):
+        self.model = model
+        self._async_client = None
+
+    def _request(self, transcription):
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": CONTEXT_ANALYSIS_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": transcription
+                }
+            ],
+            "response_format": {"type": "json_object"}
+        }
+
+    def _parse(self, content):
+        openai_analysis = json.loads(content)
+        return {
+            "sentiment_score_adjustment": openai_analysis.get("sentiment_score_adjustment", 0),
+            "detected_emotions": openai_analysis.get("detected_emotions", {}),
+            "cultural_factors": openai_analysis.get("cultural_factors", []),
+            "severity_level": openai_analysis.get("severity_level", "normal")
+        }
+
+    def analyze(self, transcription, cultural_factors=None):
+        openai_response = openai.chat.completions.create(**self._request(transcription))
+        return self._parse(openai_response.choices[0].message.content)
+
+    async def analyze_async(self, transcription, cultural_factors=None):
+        # Created on first use so it binds to the running event loop
+        if self._async_client is None:
+            self._async_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        openai_response = await self._async_client.chat.completions.create(**self._request(transcription))
+        return self._parse(openai_response.choices[0].message.content)
+
+CONTEXTUAL_ANALYZERS = {
+    "openai": OpenAIContextualAnalyzer,
+    "local": LocalContextualAnalyzer,
+    "none": NoContextualAnalyzer
+}
+
+_analyzers = {}
+
+def get_contextual_analyzer(name=None):
+    """Shared analyzer instance for the given (or configured) backend name"""
+    name = name or CONTEXTUAL_ANALYZER
+    if name not in CONTEXTUAL_ANALYZERS:
+        raise ValueError(f"Unknown contextual analyzer: {name}")
+    if name not in _analyzers:
+        _analyzers[name] = CONTEXTUAL_ANALYZERS[name]()
+    return _analyzers[name]
+
+def _fallback(transcription, cultural_factors, error):
+    print(f"Contextual analysis error: {str(error)}")
+    result = get_contextual_analyzer(CONTEXTUAL_ANALYZER_FALLBACK).analyze(transcription, cultural_factors)
+    # Marked so a transient outage is never cached as a real result
+    result["fallback"] = True
+    return result
+
+def analyze_context(transcription, cultural_factors=None):
+    """
+    Contextual analysis with the configured backend
+
+    Parameters:
+    transcription (str): Transcribed text
+    cultural_factors (dict): detect_cultural_context factors, used by the local backend
+
+    Returns:
+    dict: sentiment_score_adjustment, detected_emotions, cultural_factors, severity_level
+    """
+    try:
+        return get_contextual_analyzer().analyze(transcription, cultural_factors)
+    except Exception as e:
+        return _fallback(transcription, cultural_factors, e)
+
+async def analyze_context_async(transcription, cultural_factors=None):
+    """Async variant of analyze_context that does not block while waiting on the network"""
+    try:
+        return await get_contextual_analyzer().analyze_async(transcription, cultural_factors)
+    except Exception as e:
+        return _fallback(transcription, cultural_factors, e)
@@ -0,0 +1,131 @@
+import os
+import asyncio
+import functools
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Worker processes for CPU-bound stages (feature extraction, model inference)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", os.cpu_count() or 1))
+# Threads each worker process may use for BLAS / torch, to avoid oversubscribing the CPUs
+INFERENCE_THREADS_PER_WORKER = int(os.getenv("INFERENCE_THREADS_PER_WORKER", 1))
+# Requests admitted at once (running plus waiting for a worker) before new ones are refused
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", INFERENCE_WORKERS * 4))
+# Threads for blocking network calls (OpenAI, Spotify, YouTube)
+IO_WORKERS = int(os.getenv("IO_WORKERS", 32))
+# Seconds clients are told to wait before retrying when the queue is full
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", 5))
+# "spawn" keeps workers from inheriting torch thread pools and open sockets
+INFERENCE_START_METHOD = os.getenv("INFERENCE_START_METHOD", "spawn")
+
+class QueueFullError(Exception):
+    """Raised when the admission queue is full and the request should be retried later"""
+
+    def __init__(self, retry_after):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+def _init_worker(threads, warmup):
+    # Runs in each worker before any model module is imported
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    
+    # Load models before the worker takes its first task. A failure must not
+    # raise here, or the whole pool would be marked broken.
+    if warmup is not None:
+        try:
+            warmup()
+        except Exception as e:
+            print(f"Worker warmup failed: {str(e)}")
+
+class InferenceExecutor:
+    """
+    Runs blocking stages off the event loop behind a bounded admission queue
+
+    CPU-bound work goes to a process pool and blocking I/O to a thread pool.
+    Callers take an admission slot per request; once max_pending requests are
+    in flight, new ones fail fast with QueueFullError instead of queueing.
+    """
+
+    def __init__(self, max_workers=INFERENCE_WORKERS, max_pending=INFERENCE_MAX_PENDING,
+                 io_workers=IO_WORKERS, retry_after=INFERENCE_RETRY_AFTER, worker_warmup=None):
+        self.max_workers = max_workers
+        # Picklable function each new worker process runs before taking tasks
+        self.worker_warmup = worker_warmup
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.pending = 0
+        self.rejected = 0
+        self._process_pool = None
+        self._thread_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="io")
+
+    def _get_process_pool(self):
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(INFERENCE_START_METHOD),
+                initializer=_init_worker,
+                initargs=(INFERENCE_THREADS_PER_WORKER, self.worker_warmup)
+            )
+        return self._process_pool
+
+    def acquire(self):
+        """Take one admission slot or raise QueueFullError"""
+        # Only touched from the event loop thread, so a plain counter is enough
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after)
+        self.pending += 1
+
+    def release(self):
+        self.pending -= 1
+
+    @asynccontextmanager
+    async def admission(self):
+        """Hold one admission slot for the duration of a request"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run_cpu(self, fn, *args, **kwargs):
+        """Run a picklable, CPU-bound function in the process pool"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_process_pool()
+        try:
+            return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for later requests
+            print("Inference worker pool broke, restarting it")
+            if self._process_pool is pool:
+                self._process_pool = None
+                pool.shutdown(wait=False)
+            raise
+
+    async def run_io(self, fn, *args, **kwargs):
+        """Run a blocking I/O function in the thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._thread_pool, functools.partial(fn, *args, **kwargs))
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "maxPending": self.max_pending,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        self._thread_pool.shutdown(wait=False, cancel_futures=True)
+
+# Shared executor used by the API endpoints
+inference_executor = InferenceExecutor()
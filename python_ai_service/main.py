@@ -1,8 +1,10 @@
 
 import os
+import asyncio
 import uvicorn
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
 import numpy as np
@@ -12,10 +14,22 @@ from datetime import datetime, timedelta
 import uuid
 
 # Import our custom modules
-from audio_processor import process_audio, transcribe_audio
-from sentiment_analyzer import analyze_sentiment, get_mood_label_and_score
-from recommendation_engine import get_personalized_recommendations
+from audio_processor import decode_audio, fetch_audio, process_audio, transcribe_audio, FEATURE_PROFILES
+from transcriber import TranscriptionError, get_transcriber
+from sentiment_analyzer import (
+    analyze_sentiment_async, classify_texts, extract_texts_keywords, get_mood_label_and_score,
+    warmup_models
+)
+from recommendation_engine import (
+    get_personalized_recommendations, close_http_client, prefill_external_recommendations,
+    external_recommendation_stats, warmup_recommendation_ranking, record_recommendations,
+    recommendation_history_stats, EXTERNAL_PREFILL
+)
 from pdf_generator import generate_wellness_report
+from inference_executor import inference_executor, QueueFullError
+from batching import MicroBatcher, BATCH_MAX_SIZE
+from result_cache import cache_stats
+from streaming import AudioStream, StreamTooLongError, STREAM_DEFAULT_SAMPLE_RATE
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -23,6 +37,16 @@ load_dotenv()
 
 app = FastAPI(title="Mental Health Mirror AI Service")
 
+# Limits for the bulk /analyze-sentiment/batch endpoint
+BATCH_ENDPOINT_MAX_ITEMS = int(os.getenv("BATCH_ENDPOINT_MAX_ITEMS", 1000))
+# Chunks of BATCH_MAX_SIZE items analyzed at once per batch request
+BATCH_STREAM_CONCURRENCY = int(os.getenv("BATCH_STREAM_CONCURRENCY", 2))
+# Load models in every worker at startup so /readyz only passes once they are warm
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+
+# Readiness state reported by /readyz
+readiness = {"ready": not MODEL_WARMUP, "workers": [], "error": None}
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -32,6 +56,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def classify_text_batch(texts):
+    return await inference_executor.run_cpu(classify_texts, texts)
+
+# Groups texts from concurrent requests into one padded model batch
+text_classification_batcher = MicroBatcher(classify_text_batch)
+
+async def warm_workers():
+    """Start every worker process and wait for its models to load"""
+    try:
+        readiness["workers"] = await asyncio.gather(*[
+            inference_executor.run_cpu(warmup_models)
+            for _ in range(inference_executor.max_workers)
+        ])
+        readiness["ready"] = True
+        readiness["error"] = None
+    except Exception as e:
+        print(f"Model warmup failed: {str(e)}")
+        readiness["error"] = str(e)
+
+async def warm_recommendation_ranking():
+    """Embed the catalog off the event loop; recommendations are ranked in this process"""
+    try:
+        await inference_executor.run_io(warmup_recommendation_ranking)
+    except Exception as e:
+        print(f"Recommendation ranking warmup failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_warmup():
+    if MODEL_WARMUP:
+        inference_executor.worker_warmup = warmup_models
+        # Keep a reference so the task is not garbage collected
+        app.state.warmup_task = asyncio.ensure_future(warm_workers())
+        app.state.ranking_warmup_task = asyncio.ensure_future(warm_recommendation_ranking())
+    if EXTERNAL_PREFILL:
+        app.state.prefill_task = asyncio.ensure_future(prefill_external_recommendations())
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    inference_executor.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await close_http_client()
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service is busy, please retry later"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # Models for request/response
 class SentimentAnalysisRequest(BaseModel):
     userId: str
@@ -44,10 +120,25 @@ class SentimentAnalysisResponse(BaseModel):
     moodLabel: str
     moodScore: float
 
+class BatchSentimentItem(BaseModel):
+    id: Optional[str] = None  # Caller's reference, echoed back in the result
+    transcription: Optional[str] = None
+    audioData: Optional[str] = None  # Base64 encoded audio
+    audioUrl: Optional[str] = None  # HTTP(S) URL of a stored recording
+
+class BatchSentimentRequest(BaseModel):
+    items: List[BatchSentimentItem]
+    profile: Optional[str] = None  # Audio feature profile: "fast" or "full"
+
 class RecommendationRequest(BaseModel):
     userId: str
     moodLabel: str
     previousRecommendations: Optional[List[str]] = None
+    latestEntry: Optional[str] = None
+
+class RecommendationHistoryRequest(BaseModel):
+    userId: str
+    completedRecommendations: List[str]
 
 class ReportGenerationRequest(BaseModel):
     userId: str
@@ -59,37 +150,101 @@ class ReportGenerationRequest(BaseModel):
     completedRecommendations: List[Dict[str, Any]]
     streak: Dict[str, Any]
 
+def check_feature_profile(profile):
+    """Reject unknown feature profiles with a 400 before any work starts"""
+    if profile is not None and profile not in FEATURE_PROFILES:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown feature profile, expected one of: {', '.join(FEATURE_PROFILES)}")
+
+def decode_base64_audio(audio_data):
+    """Strip an optional data-URL prefix and decode base64 audio"""
+    return base64.b64decode(audio_data.split(",")[1] if "," in audio_data else audio_data)
+
 @app.get("/")
 def read_root():
     return {"status": "online", "service": "Mental Health Mirror AI Service"}
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving HTTP"""
+    return {"status": "ok"}
+
+def main_process_caches():
+    """
+    Result caches filled in this process
+
+    Audio features, and transcripts from a local model, are computed and cached
+    inside the process-pool workers, so their counters here would always read 0.
+    """
+    if get_transcriber().cpu_bound:
+        return ["sentiment"]
+    return ["sentiment", "transcription"]
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: models are loaded in the worker processes"""
+    body = {
+        "ready": readiness["ready"],
+        "workers": readiness["workers"],
+        "error": readiness["error"],
+        "executor": inference_executor.stats(),
+        "batcher": text_classification_batcher.stats(),
+        "caches": cache_stats(main_process_caches()),
+        "externalRecommendations": external_recommendation_stats(),
+        "recommendationHistory": recommendation_history_stats()
+    }
+    if not readiness["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 @app.post("/analyze-sentiment", response_model=SentimentAnalysisResponse)
 async def analyze_mood(request: SentimentAnalysisRequest = None, 
-                       audioFile: UploadFile = File(None)):
+                       audioFile: UploadFile = File(None),
+                       profile: Optional[str] = None):
     try:
+        check_feature_profile(profile)
+        audio_bytes = None
+        
         # Handle direct file upload
         if audioFile:
-            audio_data = await audioFile.read()
-            # Process audio file
-            audio_features = process_audio(audio_data)
-            transcription = transcribe_audio(audio_data)
+            audio_bytes = await audioFile.read()
         # Handle base64 encoded audio
         elif request and request.audioData:
-            audio_bytes = base64.b64decode(request.audioData.split(",")[1] 
-                                           if "," in request.audioData 
-                                           else request.audioData)
-            audio_features = process_audio(audio_bytes)
-            transcription = transcribe_audio(audio_bytes)
-        # Handle direct text input
-        elif request and request.transcription:
-            transcription = request.transcription
-            audio_features = None
-        else:
+            audio_bytes = decode_base64_audio(request.audioData)
+        
+        if audio_bytes is None and not (request and request.transcription):
             raise HTTPException(status_code=400, detail="No audio or text provided")
+        
+        async with inference_executor.admission():
+            if audio_bytes is not None:
+                # Decode once in memory and share it between features and transcription
+                try:
+                    audio = await inference_executor.run_cpu(decode_audio, audio_bytes)
+                except Exception as e:
+                    raise HTTPException(status_code=400, detail=f"Could not decode audio: {str(e)}")
+                # Feature extraction keeps running while we transcribe and analyze the text
+                audio_features = asyncio.ensure_future(
+                    inference_executor.run_cpu(process_audio, audio, None, profile)
+                )
+                try:
+                    transcription = await run_transcription(audio)
+                except TranscriptionError as e:
+                    # Never sentiment-score a failed transcription
+                    audio_features.cancel()
+                    raise HTTPException(status_code=502, detail=f"Transcription failed: {str(e)}")
+            # Handle direct text input
+            else:
+                transcription = request.transcription
+                audio_features = None
 
-        # Analyze sentiment from transcription and audio features
-        sentiment_analysis = analyze_sentiment(transcription, audio_features)
-        mood_label, mood_score = get_mood_label_and_score(sentiment_analysis)
+            # Text stages run concurrently; classification joins a micro-batch with other requests
+            sentiment_analysis = await analyze_sentiment_async(
+                transcription,
+                audio_features,
+                classify=text_classification_batcher.submit,
+                run_in_executor=inference_executor.run_cpu
+            )
+            mood_label, mood_score = get_mood_label_and_score(sentiment_analysis)
 
         return {
             "transcription": transcription,
@@ -97,23 +252,279 @@ async def analyze_mood(request: SentimentAnalysisRequest = None,
             "moodLabel": mood_label,
             "moodScore": mood_score
         }
+    except (HTTPException, QueueFullError):
+        raise
     except Exception as e:
         print(f"Error in sentiment analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Sentiment analysis error: {str(e)}")
 
+def run_transcription(audio):
+    """Transcribe in the process pool for local models, on the I/O pool for hosted ones"""
+    if get_transcriber().cpu_bound:
+        return inference_executor.run_cpu(transcribe_audio, audio)
+    return inference_executor.run_io(transcribe_audio, audio)
+
+async def prepare_batch_item(item, profile=None):
+    """Resolve one batch item to (transcription, audio_features)"""
+    if item.audioData or item.audioUrl:
+        if item.audioData:
+            audio_bytes = decode_base64_audio(item.audioData)
+        else:
+            audio_bytes = await inference_executor.run_io(fetch_audio, item.audioUrl)
+        audio = await inference_executor.run_cpu(decode_audio, audio_bytes)
+        audio_features, transcription = await asyncio.gather(
+            inference_executor.run_cpu(process_audio, audio, None, profile),
+            run_transcription(audio)
+        )
+        return transcription, audio_features
+    if item.transcription:
+        return item.transcription, None
+    raise ValueError("No audio or text provided")
+
+async def analyze_batch_chunk(start, items, profile=None):
+    """Analyze one chunk of a batch request and return its NDJSON records"""
+    prepared = await asyncio.gather(*[prepare_batch_item(item, profile) for item in items],
+                                    return_exceptions=True)
+    
+    records = [None] * len(items)
+    ready = []
+    for offset, (item, result) in enumerate(zip(items, prepared)):
+        if isinstance(result, Exception):
+            records[offset] = {"index": start + offset, "id": item.id, "error": str(result)}
+        else:
+            ready.append((offset, result))
+    
+    if ready:
+        # The chunk's texts go through spaCy in one nlp.pipe pass in the process pool,
+        # started by the first item that misses the result cache
+        texts = [transcription for _, (transcription, _) in ready]
+        positions = {text: position for position, text in enumerate(texts)}
+        parsed = None
+        
+        async def chunk_keywords(text):
+            nonlocal parsed
+            if parsed is None:
+                parsed = asyncio.ensure_future(inference_executor.run_cpu(extract_texts_keywords, texts))
+            return (await parsed)[positions[text]]
+        
+        # Otherwise the same pipeline as /analyze-sentiment: classification joins the shared
+        # micro-batch and contextual calls are awaited on the event loop, so hosted-model
+        # round trips overlap instead of blocking a CPU worker one by one
+        analyses = await asyncio.gather(*[
+            analyze_sentiment_async(
+                transcription,
+                audio_features,
+                classify=text_classification_batcher.submit,
+                run_in_executor=inference_executor.run_cpu,
+                keywords=chunk_keywords
+            )
+            for _, (transcription, audio_features) in ready
+        ], return_exceptions=True)
+        
+        for (offset, (transcription, _)), analysis in zip(ready, analyses):
+            item = items[offset]
+            if isinstance(analysis, Exception):
+                records[offset] = {"index": start + offset, "id": item.id, "error": str(analysis)}
+                continue
+            mood_label, mood_score = get_mood_label_and_score(analysis)
+            records[offset] = {
+                "index": start + offset,
+                "id": item.id,
+                "transcription": transcription,
+                "sentiment": analysis,
+                "moodLabel": mood_label,
+                "moodScore": mood_score
+            }
+    
+    return records
+
+async def stream_batch_results(items, profile=None):
+    """Yield NDJSON lines as chunks finish, keeping a bounded number in flight"""
+    chunks = [(start, items[start:start + BATCH_MAX_SIZE])
+              for start in range(0, len(items), BATCH_MAX_SIZE)]
+    in_flight = set()
+    next_chunk = 0
+    try:
+        while next_chunk < len(chunks) or in_flight:
+            while next_chunk < len(chunks) and len(in_flight) < BATCH_STREAM_CONCURRENCY:
+                in_flight.add(asyncio.ensure_future(analyze_batch_chunk(*chunks[next_chunk], profile)))
+                next_chunk += 1
+            
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for record in task.result():
+                    yield json.dumps(record) + "\n"
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Streaming response holding an admission slot until it is sent, fails or is abandoned"""
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            inference_executor.release()
+
+@app.post("/analyze-sentiment/batch")
+async def analyze_mood_batch(request: BatchSentimentRequest):
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No items provided")
+    if len(request.items) > BATCH_ENDPOINT_MAX_ITEMS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {BATCH_ENDPOINT_MAX_ITEMS} items per batch")
+    check_feature_profile(request.profile)
+    
+    # Taken up front so a full queue still answers 503; the response releases it
+    # however it ends, including a client that disconnects before the body starts
+    inference_executor.acquire()
+    try:
+        return AdmittedStreamingResponse(stream_batch_results(request.items, request.profile),
+                                         media_type="application/x-ndjson")
+    except BaseException:
+        inference_executor.release()
+        raise
+
+async def send_ready_partials(websocket, partials, sent):
+    """Send finished partial transcripts in chunk order; returns how many have been sent"""
+    while sent < len(partials) and partials[sent].done():
+        await websocket.send_json({"type": "partial", "index": sent, "transcription": partials[sent].result()})
+        sent += 1
+    return sent
+
+@app.websocket("/ws/analyze-sentiment")
+async def analyze_mood_stream(websocket: WebSocket):
+    """
+    Analyze a recording while it is being spoken
+    
+    The client may first send {"type": "start", "sampleRate": ..., "encoding": "pcm_s16le" or
+    "pcm_f32le", "channels": ...}, then binary PCM frames, then {"type": "end"}. Features are
+    updated as frames arrive and closed chunks are transcribed right away, with a "partial"
+    message per chunk; after "end" only the tail is left before the "result" message.
+    A stream holds one admission slot from its first message until it closes, since its
+    feature blocks and transcriptions take worker time all along.
+    """
+    await websocket.accept()
+    stream = None
+    admitted = False
+    partials = []
+    sent = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                for task in partials:
+                    task.cancel()
+                return
+            
+            if message.get("bytes") is not None:
+                if stream is None:
+                    inference_executor.acquire()
+                    admitted = True
+                    stream = AudioStream()
+                chunks = await inference_executor.run_io(stream.feed, message["bytes"])
+            else:
+                control = json.loads(message.get("text") or "{}")
+                if control.get("type") == "start" and stream is None:
+                    profile = control.get("profile")
+                    if profile is not None and profile not in FEATURE_PROFILES:
+                        raise ValueError(f"Unknown feature profile: {profile}")
+                    inference_executor.acquire()
+                    admitted = True
+                    stream = AudioStream(
+                        sample_rate=int(control.get("sampleRate", STREAM_DEFAULT_SAMPLE_RATE)),
+                        encoding=control.get("encoding", "pcm_s16le"),
+                        channels=int(control.get("channels", 1)),
+                        profile=profile
+                    )
+                    continue
+                if control.get("type") == "end":
+                    break
+                raise ValueError("Expected a start message, binary audio frames or an end message")
+            
+            partials.extend(asyncio.ensure_future(run_transcription(chunk)) for chunk in chunks)
+            sent = await send_ready_partials(websocket, partials, sent)
+        
+        if stream is None or not stream.samples_received:
+            raise ValueError("No audio received")
+        
+        # Only the tail is left: the last open chunk and the final aggregation
+        chunks, audio_features = await inference_executor.run_io(stream.finish)
+        partials.extend(asyncio.ensure_future(run_transcription(chunk)) for chunk in chunks)
+        await asyncio.gather(*partials)
+        await send_ready_partials(websocket, partials, sent)
+        transcription = " ".join(text for text in (task.result() for task in partials) if text)
+        
+        sentiment_analysis = await analyze_sentiment_async(
+            transcription,
+            audio_features,
+            classify=text_classification_batcher.submit,
+            run_in_executor=inference_executor.run_cpu
+        )
+        mood_label, mood_score = get_mood_label_and_score(sentiment_analysis)
+        
+        await websocket.send_json({
+            "type": "result",
+            "transcription": transcription,
+            "duration": stream.duration,
+            "sentiment": sentiment_analysis,
+            "moodLabel": mood_label,
+            "moodScore": mood_score
+        })
+        await websocket.close()
+    except Exception as e:
+        for task in partials:
+            task.cancel()
+        if isinstance(e, TranscriptionError):
+            detail = f"Transcription failed: {str(e)}"
+        elif isinstance(e, QueueFullError):
+            detail = "Service is busy, please retry later"
+        elif isinstance(e, (ValueError, StreamTooLongError)):
+            detail = str(e)
+        else:
+            print(f"Error in streaming sentiment analysis: {str(e)}")
+            detail = f"Sentiment analysis error: {str(e)}"
+        try:
+            await websocket.send_json({"type": "error", "detail": detail})
+            await websocket.close(code=1011)
+        except Exception:
+            # The client is already gone
+            pass
+    finally:
+        if admitted:
+            inference_executor.release()
+
 @app.post("/get-recommendations")
 async def get_recommendations(request: RecommendationRequest):
     try:
-        recommendations = get_personalized_recommendations(
-            request.userId,
-            request.moodLabel,
-            request.previousRecommendations or []
-        )
+        async with inference_executor.admission():
+            # Catalog and history work runs on the I/O pool; providers are awaited on the event loop
+            recommendations = await get_personalized_recommendations(
+                request.userId,
+                request.moodLabel,
+                request.previousRecommendations or [],
+                request.latestEntry,
+                run_in_executor=inference_executor.run_io
+            )
         return {"recommendations": recommendations}
+    except QueueFullError:
+        raise
     except Exception as e:
         print(f"Error in recommendation engine: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Recommendation error: {str(e)}")
 
+@app.post("/recommendation-history")
+async def update_recommendation_history(request: RecommendationHistoryRequest):
+    """Record completed recommendations so they are not recommended again within the history window"""
+    try:
+        # History writes may wait on the SQLite write lock; keep them off the event loop
+        await inference_executor.run_io(record_recommendations, request.userId, request.completedRecommendations)
+        return {"recorded": len(request.completedRecommendations)}
+    except Exception as e:
+        print(f"Error recording recommendation history: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Recommendation history error: {str(e)}")
+
 @app.post("/generate-report")
 async def generate_report(
     background_tasks: BackgroundTasks,
@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+
+def _current_rss_bytes():
+    """Resident set size of this process, or None if it cannot be read"""
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class ModelRegistry:
+    """
+    Loads models on first use (or on an explicit warmup) instead of at import time
+
+    Each model is registered with a zero-argument loader. The first get()
+    runs the loader once under a per-model lock, and records how long loading
+    took and how much resident memory it added.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+
+    def register(self, name, loader):
+        with self._registry_lock:
+            self._loaders[name] = loader
+            self._locks[name] = threading.Lock()
+
+    def get(self, name):
+        """Return the named model, loading it if needed"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model: {name}")
+
+        with self._locks[name]:
+            # Another thread may have finished loading while we waited
+            if name in self._models:
+                return self._models[name]
+
+            rss_before = _current_rss_bytes()
+            started = time.perf_counter()
+            model = self._loaders[name]()
+            load_seconds = time.perf_counter() - started
+            rss_after = _current_rss_bytes()
+
+            self._stats[name] = {
+                "loadSeconds": round(load_seconds, 3),
+                "memoryBytes": (rss_after - rss_before
+                                if rss_before is not None and rss_after is not None else None)
+            }
+            self._models[name] = model
+            print(f"Loaded model '{name}' in {load_seconds:.2f}s")
+            return model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def warmup(self, names=None):
+        """Load the given models (all registered ones by default)"""
+        for name in names or list(self._loaders):
+            self.get(name)
+        return self.stats()
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "models": {
+                name: dict(loaded=name in self._models, **self._stats.get(name, {}))
+                for name in self._loaders
+            }
+        }
+
+# Registry shared by the analysis modules in this process
+registry = ModelRegistry()
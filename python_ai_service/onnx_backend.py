@@ -0,0 +1,245 @@
+import os
+import time
+import inspect
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Where exported (and quantized) ONNX graphs are cached
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_models")
+ONNX_OPSET = 14
+
+def _model_dir(model_name, output_dir=ONNX_MODEL_DIR):
+    return os.path.join(output_dir, model_name.replace("/", "__"))
+
+def _temp_path(path):
+    """Per-process sibling of path, keeping the .onnx extension"""
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{os.getpid()}.tmp{extension}"
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def export_onnx(model_name, output_dir=ONNX_MODEL_DIR, quantize=False):
+    """
+    Export a Hugging Face sequence classifier to ONNX, optionally int8-quantized
+
+    The export is cached, so this is a no-op when the graph already exists.
+    Graphs are written to a per-process temp file and moved into place once
+    complete, after the tokenizer and config, so worker processes exporting
+    at the same time never load a partial graph.
+
+    Parameters:
+    model_name (str): Hugging Face model ID
+    output_dir (str): Directory holding exported models
+    quantize (bool): Also produce a dynamically int8-quantized graph and return its path
+
+    Returns:
+    str: Path of the ONNX graph to load
+    """
+    model_dir = _model_dir(model_name, output_dir)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        os.makedirs(model_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        model.eval()
+
+        # Keep the tokenizer and label mapping next to the graph; saved first,
+        # since an existing graph is taken to mean the directory is complete
+        tokenizer.save_pretrained(model_dir)
+        model.config.save_pretrained(model_dir)
+
+        sample = tokenizer(["How are you feeling today?"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask") if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+
+        # Newer torch defaults to the dynamo exporter, whose graphs trip up
+        # quantize_dynamic's shape inference; keep the TorchScript exporter
+        export_kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            export_kwargs["dynamo"] = False
+
+        temp_path = _temp_path(fp32_path)
+        try:
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    tuple(sample[name] for name in input_names),
+                    temp_path,
+                    input_names=input_names,
+                    output_names=["logits"],
+                    dynamic_axes=dynamic_axes,
+                    opset_version=ONNX_OPSET,
+                    **export_kwargs
+                )
+            os.replace(temp_path, fp32_path)
+        finally:
+            _remove_quietly(temp_path)
+
+    if not quantize:
+        return fp32_path
+
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        temp_path = _temp_path(int8_path)
+        try:
+            quantize_dynamic(fp32_path, temp_path, weight_type=QuantType.QInt8)
+            os.replace(temp_path, int8_path)
+        finally:
+            _remove_quietly(temp_path)
+
+    return int8_path
+
+class OnnxTextClassifier:
+    """
+    ONNX Runtime replacement for a transformers text-classification pipeline
+
+    Called with a string or a list of strings, it returns one
+    {"label": ..., "score": ...} dict per text, like the pipeline does for
+    single-label models (softmax over the logits, top class).
+    """
+
+    def __init__(self, model_path, tokenizer, id2label, max_length=512):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        # Respect the per-worker thread cap set by the inference executor
+        threads = int(os.getenv("OMP_NUM_THREADS", 0))
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.tokenizer = tokenizer
+        self.id2label = id2label
+        self.max_length = max_length
+
+    def __call__(self, texts, batch_size=8, truncation=True, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+
+        results = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            encoded = self.tokenizer(batch, padding=True, truncation=truncation,
+                                     max_length=self.max_length, return_tensors="np")
+            feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            logits = self.session.run(None, feed)[0]
+
+            # Numerically stable softmax
+            logits = logits - logits.max(axis=1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+            for row in probabilities:
+                index = int(np.argmax(row))
+                results.append({"label": self.id2label[index], "score": float(row[index])})
+
+        return results
+
+def load_onnx_classifier(model_name, quantize=False, output_dir=ONNX_MODEL_DIR):
+    """
+    Load (exporting on first use) an ONNX classifier for a Hugging Face model
+
+    Parameters:
+    model_name (str): Hugging Face model ID
+    quantize (bool): Use the dynamically int8-quantized graph
+    output_dir (str): Directory holding exported models
+
+    Returns:
+    OnnxTextClassifier: Callable with the same output format as the pipeline
+    """
+    from transformers import AutoConfig, AutoTokenizer
+
+    model_path = export_onnx(model_name, output_dir, quantize=quantize)
+    model_dir = os.path.dirname(model_path)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    config = AutoConfig.from_pretrained(model_dir)
+    id2label = {int(index): label for index, label in config.id2label.items()}
+    return OnnxTextClassifier(model_path, tokenizer, id2label)
+
+# Short check-in style texts used by the parity and latency check
+SAMPLE_TEXTS = [
+    "I feel great today, the exams went really well!",
+    "My manager keeps piling on deadlines and I can't sleep.",
+    "Just a normal day, nothing much happened.",
+    "I miss my family so much, it's been months since I went home.",
+    "Did yoga in the morning and feel calm and relaxed.",
+    "Everyone keeps comparing me to my cousin, log kya kahenge...",
+    "I'm scared about the results, what if I don't get a good rank?",
+    "Had a lovely dinner with my parents and grandparents.",
+]
+
+def compare_backends(model_name, texts=SAMPLE_TEXTS, repeats=20, batch_size=8):
+    """
+    Check ONNX outputs against the PyTorch pipeline and compare latency
+
+    Parameters:
+    model_name (str): Hugging Face model ID
+    texts (list): Texts to classify
+    repeats (int): Timed runs per backend
+    batch_size (int): Texts per forward pass
+
+    Returns:
+    dict: Per-backend label agreement, max score difference and median latency
+    """
+    from transformers import pipeline
+
+    backends = {
+        "pytorch": pipeline("text-classification", model=model_name),
+        "onnx": load_onnx_classifier(model_name, quantize=False),
+        "onnx-int8": load_onnx_classifier(model_name, quantize=True)
+    }
+
+    reference = backends["pytorch"](texts, batch_size=batch_size, truncation=True)
+    report = {}
+
+    for name, classifier in backends.items():
+        outputs = classifier(texts, batch_size=batch_size, truncation=True)
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            classifier(texts, batch_size=batch_size, truncation=True)
+            timings.append(time.perf_counter() - started)
+
+        report[name] = {
+            "labelAgreement": float(np.mean([
+                output["label"] == expected["label"] for output, expected in zip(outputs, reference)
+            ])),
+            "maxScoreDiff": float(max(
+                abs(output["score"] - expected["score"]) for output, expected in zip(outputs, reference)
+            )),
+            "medianMs": float(np.median(timings) * 1000)
+        }
+
+    return report
+
+if __name__ == "__main__":
+    from sentiment_analyzer import MODEL_NAME, EMOTION_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Export and check ONNX text classifiers")
+    parser.add_argument("command", choices=["export", "compare"])
+    args = parser.parse_args()
+
+    for model_name in (MODEL_NAME, EMOTION_MODEL_NAME):
+        if args.command == "export":
+            print(f"{model_name}: {export_onnx(model_name, quantize=True)}")
+        else:
+            print(model_name)
+            for backend, result in compare_backends(model_name).items():
+                print(f"  {backend:10s} agreement={result['labelAgreement']:.2f} "
+                      f"max_score_diff={result['maxScoreDiff']:.4f} median={result['medianMs']:.1f}ms")
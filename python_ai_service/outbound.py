@@ -0,0 +1,186 @@
+import os
+import time
+import asyncio
+import threading
+import concurrent.futures
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Connection pool shared by every outbound provider call
+OUTBOUND_MAX_CONNECTIONS = int(os.getenv("OUTBOUND_MAX_CONNECTIONS", 50))
+OUTBOUND_MAX_KEEPALIVE = int(os.getenv("OUTBOUND_MAX_KEEPALIVE", 20))
+# Transport-level backstop; callers apply their own, tighter budgets
+OUTBOUND_TIMEOUT = float(os.getenv("OUTBOUND_TIMEOUT", 5.0))
+# Credentials are refreshed this many seconds before they expire
+CREDENTIAL_REFRESH_MARGIN = float(os.getenv("CREDENTIAL_REFRESH_MARGIN", 60))
+
+class _LeaderCancelled(Exception):
+    """Handed to followers when the caller running the shared call is cancelled"""
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one
+
+    The first caller for a key runs the call; everyone else arriving while
+    it is in flight waits on the same future and gets the same result or
+    exception. A caller that is cancelled does not take the others with it:
+    a cancelled follower just stops waiting, and when the leader is
+    cancelled one of the followers starts the call again and leads it.
+    Keys are tracked under a thread lock and the shared future is a
+    concurrent.futures.Future, so the bookkeeping does not depend on which
+    event loop a caller runs on; the call itself must be valid on the
+    caller's loop (the shared HTTP client belongs to one loop).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = concurrent.futures.Future()
+            # A running future cannot be cancelled, so a follower that goes away
+            # (its wrapper is cancelled) never cancels the result for everyone else
+            future.set_running_or_notify_cancel()
+            self._calls[key] = future
+            self.calls += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def do(self, key, call):
+        """Await call() once for all concurrent callers of key"""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return await asyncio.wrap_future(future)
+                except _LeaderCancelled:
+                    # The first follower back here leads a new call, the rest follow it
+                    continue
+            try:
+                result = await call()
+            except asyncio.CancelledError:
+                self._finish(key, future, error=_LeaderCancelled())
+                raise
+            except BaseException as e:
+                self._finish(key, future, error=e)
+                raise
+            self._finish(key, future, result=result)
+            return result
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared}
+
+class CredentialCache:
+    """
+    An expiring credential refreshed with single-flight semantics
+
+    fetch is a coroutine function returning (credential, expires_in_seconds).
+    However many tasks find the credential expired at once, only one of them
+    posts to the token endpoint and the rest share its result.
+    """
+
+    def __init__(self, name, fetch, refresh_margin=CREDENTIAL_REFRESH_MARGIN):
+        self.name = name
+        self.fetch = fetch
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._credential = None
+        self._expires_at = 0.0
+        self._flight = SingleFlight()
+
+    def _current(self):
+        with self._lock:
+            if self._credential is not None and time.monotonic() < self._expires_at:
+                return self._credential
+        return None
+
+    async def _refresh(self):
+        credential, expires_in = await self.fetch()
+        with self._lock:
+            self._credential = credential
+            self._expires_at = time.monotonic() + max(0.0, expires_in - self.refresh_margin)
+        return credential
+
+    async def get(self):
+        """A valid credential, refreshing it first if needed"""
+        credential = self._current()
+        if credential is not None:
+            return credential
+        return await self._flight.do(self.name, self._refresh)
+
+    def invalidate(self, credential=None):
+        """Drop the cached credential (e.g. after a 401); a newer one is kept"""
+        with self._lock:
+            if credential is None or credential == self._credential:
+                self._credential = None
+                self._expires_at = 0.0
+
+    def stats(self):
+        return {"valid": self._current() is not None, "refreshes": self._flight.calls}
+
+# Pooled HTTP client, created on first use inside the running event loop
+_http_client = None
+# Identical requests in flight at the same time share one upstream call
+_request_flight = SingleFlight()
+
+def get_http_client():
+    """
+    Shared async HTTP client; connections (and TLS sessions) are reused across requests
+
+    The client belongs to the event loop it is first used on, so call this
+    (and everything built on it) from the service's loop only, not from
+    worker threads or other loops.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OUTBOUND_TIMEOUT),
+            limits=httpx.Limits(max_connections=OUTBOUND_MAX_CONNECTIONS,
+                                max_keepalive_connections=OUTBOUND_MAX_KEEPALIVE)
+        )
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def get(url, params=None, headers=None):
+    """
+    GET through the shared client, coalesced with identical requests in flight
+
+    Parameters:
+    url (str): Request URL
+    params (dict): Query parameters
+    headers (dict): Request headers (part of the identity, so different credentials never share)
+
+    Returns:
+    httpx.Response: The (possibly shared) response, already read
+    """
+    key = (
+        "GET", url,
+        tuple(sorted((params or {}).items())),
+        tuple(sorted((headers or {}).items()))
+    )
+    return await _request_flight.do(key, lambda: get_http_client().get(url, params=params, headers=headers))
+
+def outbound_stats():
+    return {"requests": _request_flight.stats()}
@@ -1,5 +1,7 @@
 
 import os
+import uuid
+import random
 from datetime import datetime
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
@@ -17,19 +19,83 @@ try:
         TTFont('NotoSansDevanagari', 'NotoSansDevanagari-Regular.ttf')
     )
     HAS_INDIC_FONTS = True
-except:
+except Exception:
     HAS_INDIC_FONTS = False
 
-# Import plotting library for mood charts
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
+# Charts are drawn on their own Figure with an Agg canvas; pyplot's global
+# state is never touched, so reports can render on several threads at once
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import matplotlib.dates as mdates
 from io import BytesIO
 import numpy as np
 
-def generate_mood_chart(mood_entries, output_path):
-    """Generate a chart of mood scores over time"""
+# Color mapping for mood labels
+MOOD_COLORS = {
+    'joyful': '#FFD700',      # Gold
+    'happy': '#32CD32',       # Lime Green
+    'calm': '#87CEEB',        # Sky Blue
+    'relaxed': '#98FB98',     # Pale Green
+    'neutral': '#D3D3D3',     # Light Gray
+    'anxious': '#FFA07A',     # Light Salmon
+    'stressed': '#FF8C00',    # Dark Orange
+    'sad': '#6495ED',         # Cornflower Blue
+    'depressed': '#4682B4'    # Steel Blue
+}
+
+def _build_styles():
+    """Paragraph styles shared by every report; built once, only read while rendering"""
+    styles = getSampleStyleSheet()
+    normal_style = styles["Normal"]
+    
+    # Create custom styles
+    if HAS_INDIC_FONTS:
+        hindi_style = ParagraphStyle(
+            'HindiStyle',
+            parent=normal_style,
+            fontName='NotoSansDevanagari',
+            fontSize=11,
+            leading=14
+        )
+    else:
+        hindi_style = normal_style
+        
+    # Create a style for callouts
+    callout_style = ParagraphStyle(
+        'Callout',
+        parent=normal_style,
+        fontSize=10,
+        textColor=colors.darkblue,
+        backColor=colors.lightblue,
+        borderColor=colors.blue,
+        borderWidth=1,
+        borderPadding=5,
+        borderRadius=5,
+        leading=14
+    )
+    
+    return {
+        "title": styles["Title"],
+        "heading": styles["Heading1"],
+        "heading2": styles["Heading2"],
+        "normal": normal_style,
+        "italic": styles["Italic"],
+        "hindi": hindi_style,
+        "callout": callout_style
+    }
+
+REPORT_STYLES = _build_styles()
+
+def generate_mood_chart(mood_entries):
+    """
+    Generate a chart of mood scores over time
+    
+    Parameters:
+    mood_entries (list): List of mood entry objects
+    
+    Returns:
+    BytesIO: PNG image of the chart, or None if there are no entries
+    """
     if not mood_entries:
         return None
         
@@ -39,64 +105,47 @@ def generate_mood_chart(mood_entries, output_path):
     scores = [entry.get('moodScore', 5) for entry in mood_entries]
     labels = [entry.get('moodLabel', 'neutral') for entry in mood_entries]
     
-    # Create color mapping for mood labels
-    mood_colors = {
-        'joyful': '#FFD700',      # Gold
-        'happy': '#32CD32',       # Lime Green
-        'calm': '#87CEEB',        # Sky Blue
-        'relaxed': '#98FB98',     # Pale Green
-        'neutral': '#D3D3D3',     # Light Gray
-        'anxious': '#FFA07A',     # Light Salmon
-        'stressed': '#FF8C00',    # Dark Orange
-        'sad': '#6495ED',         # Cornflower Blue
-        'depressed': '#4682B4'    # Steel Blue
-    }
-    
     # Create figure
-    plt.figure(figsize=(10, 4))
+    fig = Figure(figsize=(10, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
     
     # Create scatter plot with colored points
-    for i, (date, score, label) in enumerate(zip(dates, scores, labels)):
-        plt.scatter(date, score, color=mood_colors.get(label, '#D3D3D3'), s=100, alpha=0.7)
+    ax.scatter(dates, scores, color=[MOOD_COLORS.get(label, '#D3D3D3') for label in labels], s=100, alpha=0.7)
     
     # Add connecting line
-    plt.plot(dates, scores, color='#A9A9A9', linestyle='-', linewidth=1, alpha=0.5)
+    ax.plot(dates, scores, color='#A9A9A9', linestyle='-', linewidth=1, alpha=0.5)
     
     # Format the plot
-    plt.title('Your Mood Journey')
-    plt.xlabel('Date')
-    plt.ylabel('Mood Score (1-10)')
-    plt.ylim(0.5, 10.5)
-    plt.yticks(range(1, 11))
+    ax.set_title('Your Mood Journey')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Mood Score (1-10)')
+    ax.set_ylim(0.5, 10.5)
+    ax.set_yticks(range(1, 11))
     
     # Format the date axis
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%d %b'))
-    plt.gca().xaxis.set_major_locator(mdates.DayLocator())
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%d %b'))
+    ax.xaxis.set_major_locator(mdates.DayLocator())
     
     # Add grid
-    plt.grid(True, linestyle='--', alpha=0.7)
+    ax.grid(True, linestyle='--', alpha=0.7)
     
     # Add mood score labels
-    for i, score in enumerate(scores):
-        plt.annotate(str(score), (mdates.date2num(dates[i]), scores[i]),
+    for date, score in zip(dates, scores):
+        ax.annotate(str(score), (mdates.date2num(date), score),
                     xytext=(0, 10), textcoords='offset points',
                     ha='center', va='bottom',
                     fontsize=9)
     
     # Improve layout
-    plt.tight_layout()
+    fig.tight_layout()
     
-    # Save to a BytesIO object
+    # Render to an in-memory PNG
     img_buffer = BytesIO()
-    plt.savefig(img_buffer, format='png', dpi=150)
-    plt.close()
+    fig.savefig(img_buffer, format='png', dpi=150)
     img_buffer.seek(0)
     
-    # Save to file
-    with open(output_path, 'wb') as f:
-        f.write(img_buffer.getvalue())
-    
-    return output_path
+    return img_buffer
 
 def generate_wellness_report(filename, user_id, mood_entries, completed_recommendations, 
                            streak_data, start_date_str, end_date_str):
@@ -122,13 +171,12 @@ def generate_wellness_report(filename, user_id, mood_entries, completed_recommen
         output_path = os.path.join(output_dir, filename)
         
         # Generate mood chart
-        chart_filename = f"mood_chart_{user_id}.png"
-        chart_path = os.path.join(output_dir, chart_filename)
-        generate_mood_chart(mood_entries, chart_path)
+        chart_image = generate_mood_chart(mood_entries)
         
-        # Create PDF document
+        # Render into memory; the file only appears once the PDF is complete
+        pdf_buffer = BytesIO()
         doc = SimpleDocTemplate(
-            output_path,
+            pdf_buffer,
             pagesize=A4,
             rightMargin=72,
             leftMargin=72,
@@ -136,38 +184,13 @@ def generate_wellness_report(filename, user_id, mood_entries, completed_recommen
             bottomMargin=18
         )
         
-        # Get styles
-        styles = getSampleStyleSheet()
-        title_style = styles["Title"]
-        heading_style = styles["Heading1"]
-        heading2_style = styles["Heading2"]
-        normal_style = styles["Normal"]
-        
-        # Create custom styles
-        if HAS_INDIC_FONTS:
-            hindi_style = ParagraphStyle(
-                'HindiStyle',
-                parent=normal_style,
-                fontName='NotoSansDevanagari',
-                fontSize=11,
-                leading=14
-            )
-        else:
-            hindi_style = normal_style
-            
-        # Create a style for callouts
-        callout_style = ParagraphStyle(
-            'Callout',
-            parent=normal_style,
-            fontSize=10,
-            textColor=colors.darkblue,
-            backColor=colors.lightblue,
-            borderColor=colors.blue,
-            borderWidth=1,
-            borderPadding=5,
-            borderRadius=5,
-            leading=14
-        )
+        # Shared styles
+        title_style = REPORT_STYLES["title"]
+        heading_style = REPORT_STYLES["heading"]
+        heading2_style = REPORT_STYLES["heading2"]
+        normal_style = REPORT_STYLES["normal"]
+        hindi_style = REPORT_STYLES["hindi"]
+        callout_style = REPORT_STYLES["callout"]
         
         # Start building the document content
         content = []
@@ -197,12 +220,12 @@ def generate_wellness_report(filename, user_id, mood_entries, completed_recommen
         content.append(Spacer(1, 0.2*inch))
         
         # Calculate average mood
+        mood_counts = {}
         if mood_entries:
             avg_mood = sum(entry.get('moodScore', 5) for entry in mood_entries) / len(mood_entries)
             content.append(Paragraph(f"Average Mood: {avg_mood:.1f}/10", normal_style))
             
             # Count entries by mood label
-            mood_counts = {}
             for entry in mood_entries:
                 label = entry.get('moodLabel', 'neutral')
                 mood_counts[label] = mood_counts.get(label, 0) + 1
@@ -221,10 +244,10 @@ def generate_wellness_report(filename, user_id, mood_entries, completed_recommen
         content.append(Spacer(1, 0.3*inch))
         
         # Add mood chart if available
-        if os.path.exists(chart_path):
+        if chart_image is not None:
             content.append(Paragraph("Your Mood Trend", normal_style))
             content.append(Spacer(1, 0.1*inch))
-            content.append(Image(chart_path, width=450, height=180))
+            content.append(Image(chart_image, width=450, height=180))
             content.append(Spacer(1, 0.3*inch))
         
         # Add insight callout
@@ -393,11 +416,18 @@ def generate_wellness_report(filename, user_id, mood_entries, completed_recommen
         
         # Footer
         footer_text = f"Generated by Mental Health Mirror on {datetime.now().strftime('%d %B %Y')}"
-        content.append(Paragraph(footer_text, styles["Italic"]))
+        content.append(Paragraph(footer_text, REPORT_STYLES["italic"]))
         
         # Build PDF document
         doc.build(content)
         
+        # Write next to the target and rename, so a concurrent render of the
+        # same report never leaves a mixed or half-written file
+        temp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(pdf_buffer.getvalue())
+        os.replace(temp_path, output_path)
+        
         return output_path
         
     except Exception as e:
@@ -0,0 +1,107 @@
+import unicodedata
+from collections import deque
+
+def _is_word_char(ch):
+    # Letters, digits and combining marks (Devanagari matras are marks, not letters)
+    return ch == "_" or unicodedata.category(ch)[0] in "LMN"
+
+def _lower_preserving_length(text):
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # A few characters expand when lowercased (e.g. "İ"); keep offsets aligned
+    return "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton for finding many phrases in one pass over a text
+
+    Phrases are matched case-insensitively unless added with
+    case_sensitive=True, and only on word boundaries, so "IT" does not match
+    inside "with". Scanning costs O(len(text) + matches), however many
+    phrases are loaded.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        self._built = True
+        self.size = 0
+
+    def add(self, phrase, payload=None, case_sensitive=False):
+        """Add a phrase; payload is returned with every match of it"""
+        key = _lower_preserving_length(phrase)
+        node = 0
+        for ch in key:
+            child = self._goto[node].get(ch)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._goto[node][ch] = child
+            node = child
+
+        self._outputs[node].append((len(key), phrase, case_sensitive, payload))
+        self._built = False
+        self.size += 1
+
+    def build(self):
+        """Compute failure links; called automatically before the first search"""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                # Phrases ending at the failure state also end here
+                self._outputs[child] = self._outputs[child] + [
+                    output for output in self._outputs[self._fail[child]]
+                    if output not in self._outputs[child]
+                ]
+
+        self._built = True
+
+    def find(self, text):
+        """
+        Find every phrase occurrence in text
+
+        Returns:
+        list: (start, end, phrase, payload) tuples in order of their end offset
+        """
+        if not self._built:
+            self.build()
+
+        lowered = _lower_preserving_length(text)
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        text_length = len(text)
+        matches = []
+        node = 0
+
+        for index, ch in enumerate(lowered):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            for length, phrase, case_sensitive, payload in outputs[node]:
+                start = index - length + 1
+                end = index + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if end < text_length and _is_word_char(text[end]):
+                    continue
+                if case_sensitive and text[start:end] != phrase:
+                    continue
+                matches.append((start, end, phrase, payload))
+
+        return matches
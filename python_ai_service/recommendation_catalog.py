@@ -0,0 +1,247 @@
+import os
+import json
+import sqlite3
+import argparse
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from result_cache import content_hash
+
+# Load environment variables
+load_dotenv()
+
+# Catalog source: a JSON file ({"mood": [items]} or [items with "moods"]) or a prebuilt
+# SQLite catalog (.db/.sqlite). Empty uses the built-in RECOMMENDATIONS_DB.
+CATALOG_SOURCE_PATH = os.getenv("CATALOG_SOURCE_PATH", "")
+# Where a JSON or built-in source is compiled to; rebuilt only when the source changes
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", "catalog/recommendations.db")
+# Bytes of the catalog file memory-mapped per connection; the OS page cache shares
+# the mapped pages between every worker process on the node
+CATALOG_MMAP_BYTES = int(os.getenv("CATALOG_MMAP_BYTES", 256 * 1024 * 1024))
+
+CATALOG_SCHEMA = """
+CREATE TABLE items (ordinal INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, type TEXT, data TEXT NOT NULL);
+CREATE TABLE item_moods (mood TEXT NOT NULL, ordinal INTEGER NOT NULL, PRIMARY KEY (mood, ordinal)) WITHOUT ROWID;
+CREATE TABLE item_tags (tag TEXT NOT NULL, ordinal INTEGER NOT NULL, PRIMARY KEY (tag, ordinal)) WITHOUT ROWID;
+CREATE INDEX items_by_type ON items (type, ordinal);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+def _source_items(source):
+    """Yield (item, moods) from either source layout, merging items listed under several moods"""
+    if isinstance(source, dict):
+        merged = {}
+        for mood, items in source.items():
+            for item in items:
+                if item["id"] not in merged:
+                    merged[item["id"]] = (item, [])
+                merged[item["id"]][1].append(mood)
+        yield from merged.values()
+    else:
+        for item in source:
+            item = dict(item)
+            moods = item.pop("moods", [])
+            yield item, moods
+
+def build_catalog(source, db_path, fingerprint=None):
+    """
+    Compile catalog items into an indexed SQLite file
+
+    Items get dense ordinals in source order (ids for bitsets and embedding rows),
+    and are indexed by mood, type and tag. The file is written next to db_path
+    and moved into place atomically, so readers never see a half-built catalog.
+
+    Parameters:
+    source (dict or list): {"mood": [items]} or [items with a "moods" list]
+    db_path (str): Catalog file to create
+    fingerprint (str): Source fingerprint stored for change detection
+
+    Returns:
+    int: Number of items
+    """
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    connection = sqlite3.connect(temp_path)
+    try:
+        connection.executescript(CATALOG_SCHEMA)
+        count = 0
+        for ordinal, (item, moods) in enumerate(_source_items(source)):
+            connection.execute("INSERT INTO items (ordinal, id, type, data) VALUES (?, ?, ?, ?)",
+                               (ordinal, item["id"], item.get("type"), json.dumps(item)))
+            connection.executemany("INSERT OR IGNORE INTO item_moods (mood, ordinal) VALUES (?, ?)",
+                                   [(mood, ordinal) for mood in moods])
+            connection.executemany("INSERT OR IGNORE INTO item_tags (tag, ordinal) VALUES (?, ?)",
+                                   [(tag, ordinal) for tag in item.get("tags", [])])
+            count += 1
+        connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                               [("fingerprint", fingerprint or ""), ("items", str(count))])
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.replace(temp_path, db_path)
+    return count
+
+class RecommendationCatalog:
+    """
+    Read-only, indexed view of a compiled catalog file
+
+    Lookups by mood, type or tag walk an index in ordinal order and skip
+    excluded ordinals with a membership test (a bitset lookup for a user's
+    history), stopping once enough items are found. Each thread gets its own read-only, memory-mapped connection.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.size = int(self._query_one("SELECT value FROM meta WHERE key = 'items'")[0])
+        self.fingerprint = self._query_one("SELECT value FROM meta WHERE key = 'fingerprint'")[0]
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            connection.execute(f"PRAGMA mmap_size = {CATALOG_MMAP_BYTES}")
+            self._local.connection = connection
+        return connection
+
+    def _query_one(self, sql, params=()):
+        return self._connection().execute(sql, params).fetchone()
+
+    def __len__(self):
+        return self.size
+
+    def _select(self, sql, params, exclude=None, limit=None):
+        items = []
+        if limit is not None and limit <= 0:
+            return items
+        for ordinal, data in self._connection().execute(sql, params):
+            if exclude is not None and ordinal in exclude:
+                continue
+            items.append(json.loads(data))
+            if limit is not None and len(items) >= limit:
+                break
+        return items
+
+    def for_mood(self, mood, exclude=None, limit=None):
+        """Items for a mood in catalog order, skipping ordinals in exclude"""
+        return self._select(
+            "SELECT i.ordinal, i.data FROM item_moods m JOIN items i ON i.ordinal = m.ordinal "
+            "WHERE m.mood = ? ORDER BY m.ordinal",
+            (mood,), exclude, limit
+        )
+
+    def for_type(self, item_type, exclude=None, limit=None):
+        """Items of a type in catalog order, skipping ordinals in exclude"""
+        return self._select("SELECT ordinal, data FROM items WHERE type = ? ORDER BY ordinal",
+                            (item_type,), exclude, limit)
+
+    def for_tag(self, tag, exclude=None, limit=None):
+        """Items with a tag in catalog order, skipping ordinals in exclude"""
+        return self._select(
+            "SELECT i.ordinal, i.data FROM item_tags t JOIN items i ON i.ordinal = t.ordinal "
+            "WHERE t.tag = ? ORDER BY t.ordinal",
+            (tag,), exclude, limit
+        )
+
+    def get(self, item_id):
+        """Item by ID, or None"""
+        row = self._query_one("SELECT data FROM items WHERE id = ?", (item_id,))
+        return json.loads(row[0]) if row else None
+
+    def ordinal(self, item_id):
+        """Dense ordinal of an item ID, or None"""
+        row = self._query_one("SELECT ordinal FROM items WHERE id = ?", (item_id,))
+        return row[0] if row else None
+
+    def ordinals(self, item_ids):
+        """Ordinals of the given IDs that are in the catalog, as an int64 array"""
+        item_ids = list(item_ids)
+        found = []
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(item_ids), 500):
+            batch = item_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            found.extend(row[0] for row in self._connection().execute(
+                f"SELECT ordinal FROM items WHERE id IN ({placeholders})", batch))
+        return np.array(found, dtype=np.int64)
+
+    def mood_ordinals(self, mood):
+        """Ordinals of a mood's items in catalog order, as an int64 array"""
+        rows = self._connection().execute("SELECT ordinal FROM item_moods WHERE mood = ? ORDER BY ordinal", (mood,))
+        return np.fromiter((row[0] for row in rows), dtype=np.int64)
+
+    def by_ordinals(self, ordinals):
+        """Items for the given ordinals, in the same order"""
+        ordinals = [int(ordinal) for ordinal in ordinals]
+        if not ordinals:
+            return []
+        placeholders = ", ".join("?" * len(ordinals))
+        items = dict(self._connection().execute(
+            f"SELECT ordinal, data FROM items WHERE ordinal IN ({placeholders})", ordinals))
+        return [json.loads(items[ordinal]) for ordinal in ordinals if ordinal in items]
+
+    def iter_items(self):
+        """(ordinal, item) for every item in ordinal order"""
+        for ordinal, data in self._connection().execute("SELECT ordinal, data FROM items ORDER BY ordinal"):
+            yield ordinal, json.loads(data)
+
+    def moods(self):
+        return [row[0] for row in self._connection().execute("SELECT DISTINCT mood FROM item_moods")]
+
+def _stored_fingerprint(db_path):
+    try:
+        connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        finally:
+            connection.close()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+def load_catalog(default_items, source_path=CATALOG_SOURCE_PATH, db_path=CATALOG_DB_PATH):
+    """
+    Open the recommendation catalog, compiling it first if its source changed
+
+    Parameters:
+    default_items (dict): Built-in {"mood": [items]} used when no source path is set
+    source_path (str): JSON source or prebuilt SQLite catalog
+    db_path (str): Where JSON and built-in sources are compiled to
+
+    Returns:
+    RecommendationCatalog: The opened catalog
+    """
+    if source_path.endswith((".db", ".sqlite", ".sqlite3")):
+        return RecommendationCatalog(source_path)
+
+    if source_path:
+        with open(source_path, "rb") as source_file:
+            raw = source_file.read()
+        fingerprint = content_hash(raw)
+        source = None
+    else:
+        raw = json.dumps(default_items, sort_keys=True)
+        fingerprint = content_hash(raw)
+        source = default_items
+
+    if _stored_fingerprint(db_path) != fingerprint:
+        count = build_catalog(source if source is not None else json.loads(raw), db_path, fingerprint)
+        print(f"Built recommendation catalog with {count} items at {db_path}")
+
+    return RecommendationCatalog(db_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a recommendation catalog into an indexed SQLite file")
+    parser.add_argument("source", help="JSON catalog: {\"mood\": [items]} or [items with \"moods\"]")
+    parser.add_argument("output", help="SQLite file to write")
+    args = parser.parse_args()
+
+    with open(args.source, "rb") as source_file:
+        raw = source_file.read()
+    print(f"{build_catalog(json.loads(raw), args.output, content_hash(raw))} items written to {args.output}")
@@ -2,10 +2,17 @@
 import os
 import json
 import random
+import time
+import asyncio
 import numpy as np
-import requests
-from datetime import datetime
 from dotenv import load_dotenv
+from model_registry import registry
+from recommendation_catalog import load_catalog
+from recommendation_ranking import RECOMMENDATION_RANKING, build_catalog_embeddings
+from recommendation_history import RecommendationHistory, OrdinalBitset
+from sentiment_analyzer import embed_texts, TEXT_EMBEDDING_VERSION
+import outbound
+from outbound import CredentialCache, close_http_client, get_http_client, outbound_stats
 
 # Load environment variables
 load_dotenv()
@@ -13,8 +20,22 @@ SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 
-# Recommendations database - in production this would be a real database
-# Here we're using a static dictionary for simplicity
+# Per-provider time budgets (seconds); a slower provider is left out of the response
+SPOTIFY_TIMEOUT = float(os.getenv("SPOTIFY_TIMEOUT", 2.0))
+YOUTUBE_TIMEOUT = float(os.getenv("YOUTUBE_TIMEOUT", 2.0))
+
+# Candidate pools per mood (and per query for YouTube), refreshed in the background.
+# Each YouTube search spends 100 quota units, so its pools live longer.
+SPOTIFY_CACHE_TTL = float(os.getenv("SPOTIFY_CACHE_TTL", 3600))
+YOUTUBE_CACHE_TTL = float(os.getenv("YOUTUBE_CACHE_TTL", 12 * 3600))
+# Stale pools are served for up to this long while refreshes keep failing
+EXTERNAL_CACHE_MAX_STALE = float(os.getenv("EXTERNAL_CACHE_MAX_STALE", 7 * 24 * 3600))
+# Candidates fetched per pool; each request samples from them
+EXTERNAL_POOL_SIZE = int(os.getenv("EXTERNAL_POOL_SIZE", 10))
+# Fill every pool at startup (9 Spotify calls, 27 YouTube searches)
+EXTERNAL_PREFILL = os.getenv("EXTERNAL_PREFILL", "false").lower() == "true"
+
+# Built-in recommendations, compiled into the catalog when CATALOG_SOURCE_PATH is not set
 RECOMMENDATIONS_DB = {
     "joyful": [
         {
@@ -220,41 +241,52 @@ RECOMMENDATIONS_DB = {
     ]
 }
 
-# Token cache for Spotify
-spotify_token = None
-spotify_token_expiry = None
+def _load_recommendation_catalog():
+    return load_catalog(RECOMMENDATIONS_DB)
+
+def _load_recommendation_embeddings():
+    return build_catalog_embeddings(registry.get("recommendation_catalog"), embed_texts, TEXT_EMBEDDING_VERSION)
+
+# Opened on first use; indexed by mood, type and tag
+registry.register("recommendation_catalog", _load_recommendation_catalog)
+# Item embeddings by catalog ordinal, for ranking against the user's latest entry
+registry.register("recommendation_embeddings", _load_recommendation_embeddings)
+
+def _load_recommendation_history():
+    return RecommendationHistory(registry.get("recommendation_catalog").fingerprint)
+
+# Recently served and completed items per user, as bitsets over catalog ordinals
+registry.register("recommendation_history", _load_recommendation_history)
+
+# IDs of provider items; every other ID refers to a catalog item
+EXTERNAL_ID_PREFIXES = ("spotify_", "youtube_")
+
+def warmup_recommendation_ranking():
+    """Load the catalog item embeddings (and the word vectors) in this process"""
+    if RECOMMENDATION_RANKING:
+        registry.get("recommendation_embeddings")
+
+async def _fetch_spotify_token():
+    """Client-credentials grant; returns (access token, lifetime in seconds)"""
+    auth_response = await get_http_client().post(
+        "https://accounts.spotify.com/api/token",
+        data={
+            "grant_type": "client_credentials",
+            "client_id": SPOTIFY_CLIENT_ID,
+            "client_secret": SPOTIFY_CLIENT_SECRET,
+        }
+    )
+    auth_response.raise_for_status()
+    auth_data = auth_response.json()
+    return auth_data["access_token"], auth_data["expires_in"]
+
+# Token cache for Spotify; one refresh at a time however many requests find it expired
+spotify_credentials = CredentialCache("spotify", _fetch_spotify_token)
 
-def get_spotify_token():
+async def get_spotify_token():
     """Get a token for Spotify API"""
-    global spotify_token, spotify_token_expiry
-    
-    current_time = datetime.now()
-    
-    # Check if token exists and is still valid
-    if spotify_token and spotify_token_expiry and spotify_token_expiry > current_time:
-        return spotify_token
-    
     try:
-        # Request new token
-        auth_url = "https://accounts.spotify.com/api/token"
-        
-        auth_response = requests.post(
-            auth_url,
-            data={
-                "grant_type": "client_credentials",
-                "client_id": SPOTIFY_CLIENT_ID,
-                "client_secret": SPOTIFY_CLIENT_SECRET,
-            }
-        )
-        
-        auth_data = auth_response.json()
-        spotify_token = auth_data["access_token"]
-        
-        # Set expiration time (usually 1 hour)
-        from datetime import timedelta
-        spotify_token_expiry = current_time + timedelta(seconds=auth_data["expires_in"] - 60)
-        
-        return spotify_token
+        return await spotify_credentials.get()
     except Exception as e:
         print(f"Error getting Spotify token: {str(e)}")
         return None
@@ -285,9 +317,9 @@ MOOD_VIDEO_QUERIES = {
     "depressed": ["depression relief meditation hindi", "positive affirmations indian", "light therapy music"]
 }
 
-def get_spotify_recommendations(mood_label):
+async def get_spotify_recommendations(mood_label, limit=3):
     """Get music recommendations from Spotify based on mood"""
-    token = get_spotify_token()
+    token = await get_spotify_token()
     if not token:
         return []
     
@@ -297,7 +329,7 @@ def get_spotify_recommendations(mood_label):
         
         # Prepare query parameters
         query_params = {
-            "limit": 3,
+            "limit": limit,
             "market": "IN"  # Target Indian market
         }
         
@@ -321,12 +353,15 @@ def get_spotify_recommendations(mood_label):
         
         # Make API request
         recommendation_url = "https://api.spotify.com/v1/recommendations"
-        response = requests.get(
+        response = await outbound.get(
             recommendation_url,
             headers={"Authorization": f"Bearer {token}"},
             params=query_params
         )
         
+        if response.status_code == 401:
+            # Revoked early; the next call fetches a new token
+            spotify_credentials.invalidate(token)
         if response.status_code != 200:
             print(f"Spotify API error: {response.status_code}")
             return []
@@ -358,7 +393,7 @@ def get_spotify_recommendations(mood_label):
         print(f"Error getting Spotify recommendations: {str(e)}")
         return []
 
-def get_youtube_videos(mood_label):
+async def get_youtube_videos(mood_label, query=None, max_results=3):
     """Get video recommendations from YouTube based on mood"""
     if not YOUTUBE_API_KEY:
         return []
@@ -368,21 +403,21 @@ def get_youtube_videos(mood_label):
         queries = MOOD_VIDEO_QUERIES.get(mood_label, MOOD_VIDEO_QUERIES["neutral"])
         
         # Choose a random query
-        query = random.choice(queries)
+        query = query or random.choice(queries)
         
         # Make API request
         search_url = "https://www.googleapis.com/youtube/v3/search"
         params = {
             "part": "snippet",
             "q": query,
-            "maxResults": 3,
+            "maxResults": max_results,
             "type": "video",
             "relevanceLanguage": "hi,en",  # Hindi and English content
             "regionCode": "IN",  # India region
             "key": YOUTUBE_API_KEY
         }
         
-        response = requests.get(search_url, params=params)
+        response = await outbound.get(search_url, params=params)
         
         if response.status_code != 200:
             print(f"YouTube API error: {response.status_code}")
@@ -427,71 +462,278 @@ def get_youtube_videos(mood_label):
         print(f"Error getting YouTube recommendations: {str(e)}")
         return []
 
-def get_personalized_recommendations(user_id, mood_label, previous_recommendations=None):
+class CandidatePool:
     """
-    Get personalized recommendations based on mood
+    In-memory candidate lists with stale-while-revalidate refresh
+
+    Fresh entries are served from memory. Stale entries are still served
+    immediately, and a single background refresh per key replaces them.
+    Only a cold key waits for the provider, within a time budget; the fetch
+    keeps running if the budget runs out, so the next request finds it filled.
+    Empty results (provider errors) never replace a good entry.
+    """
+
+    def __init__(self, name, ttl, max_stale=EXTERNAL_CACHE_MAX_STALE):
+        self.name = name
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._entries = {}
+        self._refreshing = {}
+
+    def refresh(self, key, fetch):
+        """Start a refresh for key unless one is already running; returns its task"""
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(key, fetch))
+            self._refreshing[key] = task
+        return task
+
+    async def _refresh(self, key, fetch):
+        try:
+            self.refreshes += 1
+            candidates = await fetch()
+            if candidates:
+                self._entries[key] = (time.monotonic(), candidates)
+                return candidates
+            entry = self._entries.get(key)
+            return entry[1] if entry else []
+        except Exception as e:
+            print(f"Error refreshing {self.name} candidates: {str(e)}")
+            entry = self._entries.get(key)
+            return entry[1] if entry else []
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def get(self, key, fetch, timeout):
+        """Candidates for key, fetching with the time budget only when none are cached"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            fetched_at, candidates = entry
+            age = time.monotonic() - fetched_at
+            if age <= self.ttl:
+                self.hits += 1
+                return candidates
+            if age <= self.max_stale:
+                self.stale_hits += 1
+                self.refresh(key, fetch)
+                return candidates
+        
+        self.misses += 1
+        try:
+            # Shielded so a late answer still fills the pool for later requests
+            return await asyncio.wait_for(asyncio.shield(self.refresh(key, fetch)), timeout)
+        except asyncio.TimeoutError:
+            print(f"{self.name} timed out after {timeout}s")
+            return []
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes
+        }
+
+spotify_pool = CandidatePool("spotify", SPOTIFY_CACHE_TTL)
+youtube_pool = CandidatePool("youtube", YOUTUBE_CACHE_TTL)
+
+def _pool_mood(mood_label, mapping):
+    # Unknown labels share the neutral pool, as they share its query parameters
+    return mood_label if mood_label in mapping else "neutral"
+
+async def get_spotify_candidates(mood_label, timeout=SPOTIFY_TIMEOUT):
+    mood = _pool_mood(mood_label, MOOD_MUSIC_PARAMS)
+    return await spotify_pool.get(mood, lambda: get_spotify_recommendations(mood, limit=EXTERNAL_POOL_SIZE), timeout)
+
+async def get_youtube_candidates(mood_label, query=None, timeout=YOUTUBE_TIMEOUT):
+    mood = _pool_mood(mood_label, MOOD_VIDEO_QUERIES)
+    query = query or random.choice(MOOD_VIDEO_QUERIES[mood])
+    return await youtube_pool.get(
+        (mood, query),
+        lambda: get_youtube_videos(mood, query=query, max_results=EXTERNAL_POOL_SIZE),
+        timeout
+    )
+
+async def prefill_external_recommendations():
+    """Fill every Spotify and YouTube candidate pool in the background"""
+    tasks = []
+    for mood in MOOD_MUSIC_PARAMS:
+        tasks.append(spotify_pool.refresh(
+            mood, lambda mood=mood: get_spotify_recommendations(mood, limit=EXTERNAL_POOL_SIZE)
+        ))
+    for mood, queries in MOOD_VIDEO_QUERIES.items():
+        for query in queries:
+            tasks.append(youtube_pool.refresh(
+                (mood, query),
+                lambda mood=mood, query=query: get_youtube_videos(mood, query=query, max_results=EXTERNAL_POOL_SIZE)
+            ))
+    await asyncio.gather(*tasks)
+
+def external_recommendation_stats():
+    return {
+        "spotify": spotify_pool.stats(),
+        "youtube": youtube_pool.stats(),
+        "spotifyToken": spotify_credentials.stats(),
+        "outbound": outbound_stats()
+    }
+
+def _sample_unseen(candidates, count, exclude):
+    """Sample up to count candidates, using ones in exclude only if too few others are left"""
+    unseen = [candidate for candidate in candidates if candidate["id"] not in exclude]
+    picked = random.sample(unseen, min(count, len(unseen)))
+    if len(picked) < count:
+        seen = [candidate for candidate in candidates if candidate["id"] in exclude]
+        picked.extend(random.sample(seen, min(count - len(picked), len(seen))))
+    return picked
+
+async def get_external_recommendations(mood_label, count=2, exclude=None):
+    """
+    Spotify and YouTube recommendations from the candidate pools
+    
+    Both pools are read concurrently; only a cold pool waits on its provider,
+    and only up to that provider's time budget.
+    
+    Parameters:
+    mood_label (str): Current mood label
+    count (int): Items per provider
+    exclude (set): IDs the user was recently served; other candidates are preferred
+    
+    Returns:
+    (list, list): Up to count Spotify and YouTube recommendations, sampled from the pools
+    """
+    spotify_candidates, youtube_candidates = await asyncio.gather(
+        get_spotify_candidates(mood_label),
+        get_youtube_candidates(mood_label)
+    )
+    exclude = exclude or set()
+    return (
+        _sample_unseen(spotify_candidates, count, exclude),
+        _sample_unseen(youtube_candidates, count, exclude)
+    )
+
+def select_catalog_recommendations(user_id, mood_label, previous_recommendations=None, latest_entry=None):
+    """
+    Catalog recommendations for the user, ranked and filtered by their history
+    
+    Blocking: may compile the catalog, load the word vectors and embeddings,
+    and queries SQLite. Run it off the event loop.
     
     Parameters:
     user_id (str): User ID
     mood_label (str): Current mood label
-    previous_recommendations (list): Previously given recommendations to avoid repeating
+    previous_recommendations (list): Extra IDs to avoid; the user's recent history is tracked here already
+    latest_entry (str): Text of the user's latest entry; catalog items are ranked by similarity to it
     
     Returns:
-    list: List of recommendation objects
+    (list, set): Up to 3 catalog items, and provider item IDs the user was recently served
     """
-    if previous_recommendations is None:
-        previous_recommendations = []
+    catalog = registry.get("recommendation_catalog")
+    history = registry.get("recommendation_history")
     
-    # Start with pre-defined recommendations for the mood
-    base_recommendations = RECOMMENDATIONS_DB.get(mood_label, [])
+    # Bitsets over catalog ordinals, so excluding an item is one bit test however long the history is
+    buckets = history.bucket_history(user_id)
+    excluded_external = set()
+    for _, bucket_external in buckets:
+        excluded_external.update(bucket_external)
+    requested = OrdinalBitset()
+    if previous_recommendations:
+        requested.add(catalog.ordinals(previous_recommendations))
+        excluded_external.update(previous_recommendations)
     
-    # Filter out previously recommended items
-    filtered_recommendations = [r for r in base_recommendations 
-                              if r["id"] not in previous_recommendations]
+    # Moods to fill from when the current mood has too few items: 1-2 steps away,
+    # or neutral if the mood is not on the scale
+    mood_order = ["depressed", "sad", "stressed", "anxious", "neutral", 
+                  "relaxed", "calm", "happy", "joyful"]
+    if mood_label in mood_order:
+        current_index = mood_order.index(mood_label)
+        fallback_moods = []
+        for i in range(1, 3):
+            if current_index - i >= 0:
+                fallback_moods.append(mood_order[current_index - i])
+            if current_index + i < len(mood_order):
+                fallback_moods.append(mood_order[current_index + i])
+    else:
+        fallback_moods = ["neutral"]
     
-    # If we have too few recommendations, add some from neutral mood or adjacent moods
-    if len(filtered_recommendations) < 3:
-        mood_order = ["depressed", "sad", "stressed", "anxious", "neutral", 
-                      "relaxed", "calm", "happy", "joyful"]
-        try:
-            current_index = mood_order.index(mood_label)
-            
-            # Add recommendations from adjacent moods
-            for i in range(1, 3):
-                # Get recommendations from moods that are 1-2 steps away
-                if current_index - i >= 0:
-                    adjacent_mood = mood_order[current_index - i]
-                    filtered_recommendations.extend(
-                        [r for r in RECOMMENDATIONS_DB.get(adjacent_mood, [])
-                         if r["id"] not in previous_recommendations][:1]
-                    )
-                
-                if current_index + i < len(mood_order):
-                    adjacent_mood = mood_order[current_index + i]
-                    filtered_recommendations.extend(
-                        [r for r in RECOMMENDATIONS_DB.get(adjacent_mood, [])
-                         if r["id"] not in previous_recommendations][:1]
-                    )
-        except ValueError:
-            # If mood not found in order, add neutral recommendations
-            filtered_recommendations.extend(
-                [r for r in RECOMMENDATIONS_DB.get("neutral", [])
-                 if r["id"] not in previous_recommendations][:2]
-            )
+    query = None
+    if RECOMMENDATION_RANKING and latest_entry and latest_entry.strip():
+        query = embed_texts([latest_entry])[0]
+    ranked = query is not None and query.any()
     
-    # Get external recommendations
-    spotify_recommendations = []
-    youtube_recommendations = []
+    def pick(excluded, count):
+        if ranked:
+            # Most relevant items for the mood, then for the neighbouring moods
+            embeddings = registry.get("recommendation_embeddings")
+            chosen = embeddings.top_k(query, [mood_label], count, exclude=excluded)
+            if len(chosen) < count:
+                excluded = excluded.copy()
+                excluded.add(chosen)
+                chosen = np.concatenate([chosen, embeddings.top_k(query, fallback_moods, count - len(chosen),
+                                                                  exclude=excluded)])
+            return catalog.by_ordinals(chosen)
+        
+        # Start with pre-defined recommendations for the mood
+        items = catalog.for_mood(mood_label, exclude=excluded, limit=count)
+        
+        # If we have too few recommendations, add some from adjacent moods (or neutral)
+        if len(items) < count:
+            if mood_label in mood_order:
+                # One item from each mood 1-2 steps away
+                for adjacent_mood in fallback_moods:
+                    items.extend(catalog.for_mood(adjacent_mood, exclude=excluded, limit=1))
+            else:
+                items.extend(catalog.for_mood("neutral", exclude=excluded, limit=2))
+        return items[:count]
     
-    try:
-        spotify_recommendations = get_spotify_recommendations(mood_label)
-    except Exception as e:
-        print(f"Error getting Spotify recommendations: {str(e)}")
+    # Unseen items first. When the user has seen nearly everything, forget history
+    # oldest bucket first, so the least recently seen items come back before newer ones
+    filtered_recommendations = []
+    for skip in range(len(buckets) + 2):
+        excluded = OrdinalBitset()
+        if skip <= len(buckets):
+            excluded.update(requested)
+            for bucket_bits, _ in buckets[skip:]:
+                excluded.update(bucket_bits)
+        if filtered_recommendations:
+            excluded.add(catalog.ordinals(item["id"] for item in filtered_recommendations))
+        filtered_recommendations.extend(pick(excluded, 3 - len(filtered_recommendations)))
+        if len(filtered_recommendations) >= 3:
+            break
     
-    try:
-        youtube_recommendations = get_youtube_videos(mood_label)
-    except Exception as e:
-        print(f"Error getting YouTube recommendations: {str(e)}")
+    return filtered_recommendations[:3], excluded_external
+
+async def get_personalized_recommendations(user_id, mood_label, previous_recommendations=None, latest_entry=None,
+                                           run_in_executor=None):
+    """
+    Get personalized recommendations based on mood
+    
+    Parameters:
+    user_id (str): User ID
+    mood_label (str): Current mood label
+    previous_recommendations (list): Extra IDs to avoid; the user's recent history is tracked here already
+    latest_entry (str): Text of the user's latest entry; catalog items are ranked by similarity to it
+    run_in_executor (callable): Async (fn, *args) -> result for the blocking catalog and history work
+    
+    Returns:
+    list: List of recommendation objects
+    """
+    if run_in_executor is None:
+        run_in_executor = asyncio.to_thread
+    
+    # Catalog, ranking and history run on a thread; only the provider pools are awaited on the loop
+    filtered_recommendations, excluded_external = await run_in_executor(
+        select_catalog_recommendations, user_id, mood_label, previous_recommendations, latest_entry
+    )
+    
+    # Get external recommendations, both providers at once and each within its budget
+    spotify_recommendations, youtube_recommendations = await get_external_recommendations(
+        mood_label, exclude=excluded_external
+    )
     
     # Combine all recommendations and select a balanced mix
     all_recommendations = []
@@ -509,7 +751,27 @@ def get_personalized_recommendations(user_id, mood_label, previous_recommendatio
     random.shuffle(all_recommendations)
     
     # Limit to 5 total recommendations
-    return all_recommendations[:5]
+    recommendations = all_recommendations[:5]
+    await run_in_executor(record_recommendations, user_id, [item["id"] for item in recommendations])
+    return recommendations
+
+def record_recommendations(user_id, recommendation_ids):
+    """
+    Add served or completed recommendations to the user's history
+    
+    Parameters:
+    user_id (str): User ID
+    recommendation_ids (list): Catalog or provider item IDs
+    """
+    external_ids = [item_id for item_id in recommendation_ids if item_id.startswith(EXTERNAL_ID_PREFIXES)]
+    catalog_ids = [item_id for item_id in recommendation_ids if not item_id.startswith(EXTERNAL_ID_PREFIXES)]
+    ordinals = registry.get("recommendation_catalog").ordinals(catalog_ids) if catalog_ids else []
+    registry.get("recommendation_history").record(user_id, ordinals, external_ids)
+
+def recommendation_history_stats():
+    if not registry.is_loaded("recommendation_history"):
+        return None
+    return registry.get("recommendation_history").stats()
 
 def milliseconds_to_time(ms):
     """Convert milliseconds to MM:SS format"""
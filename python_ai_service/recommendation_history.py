@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Served and completed items are not recommended again for this long
+RECOMMENDATION_HISTORY_WINDOW = float(os.getenv("RECOMMENDATION_HISTORY_WINDOW", 28 * 24 * 3600))
+# The window is kept as this many time buckets; the oldest bucket expires as a whole
+RECOMMENDATION_HISTORY_BUCKETS = int(os.getenv("RECOMMENDATION_HISTORY_BUCKETS", 4))
+# Users kept in memory (least recently active are dropped first)
+RECOMMENDATION_HISTORY_MAX_USERS = int(os.getenv("RECOMMENDATION_HISTORY_MAX_USERS", 100000))
+# Optional SQLite file; when set it holds the history for every worker process and survives restarts
+RECOMMENDATION_HISTORY_PATH = os.getenv("RECOMMENDATION_HISTORY_PATH", "")
+# Seconds between sweeps of the SQLite file for expired buckets and rows of older catalog builds
+RECOMMENDATION_HISTORY_PURGE_INTERVAL = float(os.getenv("RECOMMENDATION_HISTORY_PURGE_INTERVAL", 3600))
+
+class OrdinalBitset:
+    """A set of catalog ordinals stored as one bit per ordinal"""
+
+    def __init__(self, data=None):
+        self.data = np.zeros(0, dtype=np.uint8) if data is None else np.frombuffer(data, dtype=np.uint8).copy()
+
+    def add(self, ordinals):
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if not len(ordinals):
+            return
+        needed = int(ordinals.max() >> 3) + 1
+        if needed > len(self.data):
+            self.data = np.concatenate([self.data, np.zeros(needed - len(self.data), dtype=np.uint8)])
+        np.bitwise_or.at(self.data, ordinals >> 3, (1 << (ordinals & 7)).astype(np.uint8))
+
+    def update(self, other):
+        """Add every ordinal of another bitset"""
+        if len(other.data) > len(self.data):
+            self.data = np.concatenate([self.data, np.zeros(len(other.data) - len(self.data), dtype=np.uint8)])
+        self.data[:len(other.data)] |= other.data
+
+    def copy(self):
+        return OrdinalBitset(self.data.tobytes())
+
+    def __contains__(self, ordinal):
+        byte = ordinal >> 3
+        return byte < len(self.data) and bool((self.data[byte] >> (ordinal & 7)) & 1)
+
+    def contains(self, ordinals):
+        """Vectorized membership test: a boolean array, one entry per ordinal"""
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        found = np.zeros(len(ordinals), dtype=bool)
+        inside = (ordinals >> 3) < len(self.data)
+        found[inside] = (self.data[ordinals[inside] >> 3] >> (ordinals[inside] & 7)) & 1
+        return found
+
+    def __len__(self):
+        return int(np.unpackbits(self.data).sum())
+
+    def tobytes(self):
+        return self.data.tobytes()
+
+class RecommendationHistory:
+    """
+    Recently served and completed recommendations per user
+
+    Catalog items are kept as bitsets over catalog ordinals and external
+    (Spotify/YouTube) items as small ID sets. The time window is split into
+    buckets; new entries go into the current bucket and whole buckets expire
+    once they leave the window, so nothing is scanned item by item. History
+    is tied to one catalog build, since ordinals change when it is rebuilt.
+
+    Reads and writes block (on the lock and, with a disk tier, on SQLite), so
+    callers on an event loop run them in a thread.
+    """
+
+    def __init__(self, fingerprint, window=RECOMMENDATION_HISTORY_WINDOW, buckets=RECOMMENDATION_HISTORY_BUCKETS,
+                 max_users=RECOMMENDATION_HISTORY_MAX_USERS, disk_path=RECOMMENDATION_HISTORY_PATH,
+                 purge_interval=RECOMMENDATION_HISTORY_PURGE_INTERVAL):
+        self.fingerprint = fingerprint
+        self.buckets = max(1, buckets)
+        self.bucket_seconds = window / self.buckets
+        self.max_users = max_users
+        self.purge_interval = purge_interval
+        # The first write sweeps, so rows of a previous catalog build go soon after a rebuild
+        self._last_purge = None
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, disk_path):
+        try:
+            self._disk = sqlite3.connect(disk_path, timeout=5, check_same_thread=False, isolation_level=None)
+            # WAL lets the worker processes read while one of them writes
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS history (user_id TEXT, bucket INTEGER, fingerprint TEXT, "
+                "ordinals BLOB, external TEXT, PRIMARY KEY (user_id, bucket))"
+            )
+        except sqlite3.Error as e:
+            print(f"Recommendation history disk tier disabled: {str(e)}")
+            self._disk = None
+
+    def _current_bucket(self, now=None):
+        return int((time.time() if now is None else now) // self.bucket_seconds)
+
+    def _memory_buckets(self, user_id, oldest):
+        """The user's live in-memory buckets; expired ones are dropped"""
+        buckets = self._users.get(user_id)
+        if buckets is None:
+            return None
+        for bucket in [bucket for bucket in buckets if bucket < oldest]:
+            del buckets[bucket]
+        self._users.move_to_end(user_id)
+        return buckets
+
+    def _disk_rows(self, user_id, oldest, bucket=None):
+        sql = "SELECT bucket, ordinals, external FROM history WHERE user_id = ? AND fingerprint = ? AND bucket >= ?"
+        params = [user_id, self.fingerprint, oldest]
+        if bucket is not None:
+            sql += " AND bucket = ?"
+            params.append(bucket)
+        return self._disk.execute(sql, params).fetchall()
+
+    def record(self, user_id, ordinals=(), external_ids=(), now=None):
+        """
+        Add served or completed items to the user's current bucket
+
+        Parameters:
+        user_id (str): User ID
+        ordinals (list): Catalog ordinals
+        external_ids (list): IDs of items that are not in the catalog
+        now (float): Timestamp, for tests and replays
+        """
+        current = self._current_bucket(now)
+        oldest = current - self.buckets + 1
+        with self._lock:
+            if self._disk is not None:
+                try:
+                    self._disk.execute("BEGIN IMMEDIATE")
+                    try:
+                        rows = self._disk_rows(user_id, oldest, current)
+                        bits = OrdinalBitset(rows[0][1]) if rows else OrdinalBitset()
+                        external = set(json.loads(rows[0][2])) if rows else set()
+                        bits.add(ordinals)
+                        external.update(external_ids)
+                        self._disk.execute(
+                            "INSERT OR REPLACE INTO history (user_id, bucket, fingerprint, ordinals, external) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (user_id, current, self.fingerprint, bits.tobytes(), json.dumps(sorted(external)))
+                        )
+                        self._disk.execute("DELETE FROM history WHERE user_id = ? AND bucket < ?", (user_id, oldest))
+                        self._disk.execute("COMMIT")
+                    except BaseException:
+                        self._disk.execute("ROLLBACK")
+                        raise
+                except sqlite3.Error as e:
+                    print(f"Recommendation history write error: {str(e)}")
+                if self._last_purge is None or time.monotonic() - self._last_purge >= self.purge_interval:
+                    self._purge_disk(oldest)
+                return
+
+            buckets = self._memory_buckets(user_id, oldest)
+            if buckets is None:
+                buckets = self._users[user_id] = {}
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            bits, external = buckets.setdefault(current, (OrdinalBitset(), set()))
+            bits.add(ordinals)
+            external.update(external_ids)
+
+    def _purge_disk(self, oldest):
+        """Delete expired buckets of every user and rows left by other catalog builds"""
+        self._last_purge = time.monotonic()
+        try:
+            deleted = self._disk.execute(
+                "DELETE FROM history WHERE bucket < ? OR fingerprint != ?", (oldest, self.fingerprint)
+            ).rowcount
+            if deleted:
+                print(f"Purged {deleted} recommendation history rows")
+        except sqlite3.Error as e:
+            print(f"Recommendation history purge error: {str(e)}")
+
+    def bucket_history(self, user_id, now=None):
+        """
+        The user's live buckets, oldest first
+
+        Returns:
+        list: (OrdinalBitset of catalog ordinals, set of external IDs) per bucket
+        """
+        oldest = self._current_bucket(now) - self.buckets + 1
+        with self._lock:
+            if self._disk is not None:
+                try:
+                    rows = sorted(self._disk_rows(user_id, oldest))
+                except sqlite3.Error as e:
+                    print(f"Recommendation history read error: {str(e)}")
+                    return []
+                return [(OrdinalBitset(data), set(json.loads(external_json))) for _, data, external_json in rows]
+
+            buckets = self._memory_buckets(user_id, oldest) or {}
+            return [(buckets[bucket][0].copy(), set(buckets[bucket][1])) for bucket in sorted(buckets)]
+
+    def exclusion(self, user_id, now=None):
+        """
+        Everything the user was served or completed within the window
+
+        Returns:
+        tuple: (OrdinalBitset of catalog ordinals, set of external IDs)
+        """
+        bits = OrdinalBitset()
+        external = set()
+        for bucket_bits, bucket_external in self.bucket_history(user_id, now):
+            bits.update(bucket_bits)
+            external.update(bucket_external)
+        return bits, external
+
+    def stats(self):
+        return {"users": len(self._users), "disk": self._disk is not None}
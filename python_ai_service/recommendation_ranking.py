@@ -0,0 +1,115 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+from result_cache import content_hash
+
+# Load environment variables
+load_dotenv()
+
+# Rank catalog items by similarity to the user's latest entry
+RECOMMENDATION_RANKING = os.getenv("RECOMMENDATION_RANKING", "true").lower() == "true"
+# Store the item embeddings next to the catalog file so restarts and other
+# worker processes reuse them (memory-mapped) instead of re-embedding
+CATALOG_EMBEDDINGS_CACHE = os.getenv("CATALOG_EMBEDDINGS_CACHE", "true").lower() == "true"
+
+def item_text(item):
+    """The text an item is embedded from: title, description and tags"""
+    return ". ".join([item.get("title", ""), item.get("description", ""), " ".join(item.get("tags", []))])
+
+class CatalogEmbeddings:
+    """
+    L2-normalized float32 embeddings of the catalog items, laid out mood by mood
+
+    Each mood's items are one contiguous block of rows (in ordinal order), so
+    ranking a mood is a single matrix-vector product over its block (cosine
+    similarity, since rows and query are unit length) followed by an
+    argpartition top-k. No rows are gathered and no Python loop runs per item.
+    """
+
+    def __init__(self, matrix, mood_ordinals):
+        self.matrix = matrix
+        self.mood_ordinals = mood_ordinals
+        self.mood_rows = {}
+        offset = 0
+        for mood in sorted(mood_ordinals):
+            self.mood_rows[mood] = (offset, offset + len(mood_ordinals[mood]))
+            offset += len(mood_ordinals[mood])
+
+    def top_k(self, query, moods, k, exclude=None):
+        """
+        The k items of the given moods most similar to the query
+
+        Parameters:
+        query (np.ndarray): L2-normalized query embedding
+        moods (list): Moods whose items are candidates
+        k (int): Number of items to return
+        exclude (OrdinalBitset): Ordinals that must not be returned
+
+        Returns:
+        np.ndarray: Ordinals, most similar first
+        """
+        moods = [mood for mood in moods if mood in self.mood_rows]
+        if k <= 0 or not moods:
+            return np.zeros(0, dtype=np.int64)
+
+        ordinals = np.concatenate([self.mood_ordinals[mood] for mood in moods])
+        scores = np.concatenate([self.matrix[slice(*self.mood_rows[mood])] @ query for mood in moods])
+        if len(moods) > 1:
+            # An item listed under several of the moods is scored once
+            ordinals, first = np.unique(ordinals, return_index=True)
+            scores = scores[first]
+        if exclude is not None:
+            # One bit lookup per candidate
+            keep = ~exclude.contains(ordinals)
+            ordinals, scores = ordinals[keep], scores[keep]
+
+        if len(ordinals) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(ordinals))
+        # Stable sort keeps catalog order between equal scores
+        return ordinals[best[np.argsort(-scores[best], kind="stable")]]
+
+def _embeddings_cache_path(catalog, version):
+    stem = os.path.splitext(catalog.db_path)[0]
+    return f"{stem}.embeddings.{content_hash(f'{catalog.fingerprint}|{version}')[:16]}.npy"
+
+def build_catalog_embeddings(catalog, embed, version):
+    """
+    Embed every catalog item once
+
+    Parameters:
+    catalog (RecommendationCatalog): The catalog to embed
+    embed (callable): Function mapping a list of texts to a normalized float32 matrix
+    version (str): Identifies the embedding model, so a cached matrix follows model changes
+
+    Returns:
+    CatalogEmbeddings: Item embeddings in per-mood blocks
+    """
+    mood_ordinals = {mood: catalog.mood_ordinals(mood) for mood in sorted(catalog.moods())}
+    rows = sum(len(ordinals) for ordinals in mood_ordinals.values())
+    path = _embeddings_cache_path(catalog, version)
+
+    if CATALOG_EMBEDDINGS_CACHE and os.path.exists(path):
+        matrix = np.load(path, mmap_mode="r")
+        if matrix.shape[0] == rows:
+            return CatalogEmbeddings(matrix, mood_ordinals)
+
+    # Rows are indexed by ordinal here, then copied into the mood blocks
+    item_matrix = embed([item_text(item) for _, item in catalog.iter_items()])
+    print(f"Embedded {item_matrix.shape[0]} catalog items")
+    if mood_ordinals:
+        matrix = np.ascontiguousarray(item_matrix[np.concatenate(list(mood_ordinals.values()))])
+    else:
+        matrix = item_matrix[:0]
+
+    if CATALOG_EMBEDDINGS_CACHE:
+        temp_path = f"{path}.{os.getpid()}.tmp.npy"
+        try:
+            np.save(temp_path, matrix)
+            os.replace(temp_path, path)
+        except OSError as e:
+            # A read-only catalog location only costs re-embedding on the next start
+            print(f"Error caching catalog embeddings: {str(e)}")
+
+    return CatalogEmbeddings(matrix, mood_ordinals)
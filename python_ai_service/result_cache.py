@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# In-process LRU tier
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 10000))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 24 * 3600))
+# Optional SQLite file shared by all worker processes on the node (empty disables it)
+RESULT_CACHE_DISK_PATH = os.getenv("RESULT_CACHE_DISK_PATH", "")
+# Rows kept in the disk file (across every cache sharing it); soonest-expiring rows go first
+RESULT_CACHE_DISK_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_DISK_MAX_ENTRIES", 100000))
+# Each process sweeps expired rows and enforces the cap once every this many disk writes
+RESULT_CACHE_DISK_PURGE_EVERY = int(os.getenv("RESULT_CACHE_DISK_PURGE_EVERY", 1000))
+# Bump to invalidate every cached entry, e.g. after changing prompts or lexicons
+CACHE_VERSION = os.getenv("CACHE_VERSION", "1")
+
+# Every cache created in this process, for stats reporting
+_caches = []
+
+def normalize_text(text):
+    """Canonical form of a text for cache keys: NFC, trimmed, single-spaced"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def content_hash(data):
+    """SHA-256 hex digest of bytes or text"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+class ResultCache:
+    """
+    Content-addressed cache with an in-process LRU and an optional disk tier
+
+    Keys combine a model-version string with content hashes, so changing a
+    model or its configuration naturally misses old entries. Entries expire
+    after ttl seconds in both tiers. Values must be JSON-serializable.
+    Callers on an event loop use get_async/set_async, which run the disk
+    tier in a thread.
+    Expired disk rows are deleted when the file is opened and every
+    RESULT_CACHE_DISK_PURGE_EVERY writes, which also trims the file to
+    disk_max_entries rows.
+    """
+
+    def __init__(self, name, version, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL,
+                 disk_path=RESULT_CACHE_DISK_PATH, disk_max_entries=RESULT_CACHE_DISK_MAX_ENTRIES):
+        self.name = name
+        self.version = f"{CACHE_VERSION}|{version}"
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.ttl = ttl
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # The memory tier and the SQLite connection have separate locks, so a slow
+        # disk call never holds up in-memory lookups
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            self._open_disk(disk_path)
+        _caches.append(self)
+
+    def _open_disk(self, disk_path):
+        try:
+            self._disk = sqlite3.connect(disk_path, timeout=5, check_same_thread=False)
+            # WAL lets the worker processes read while one of them writes
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, expires_at REAL, value TEXT)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS results_by_expiry ON results (expires_at)")
+            self._disk.commit()
+        except sqlite3.Error as e:
+            print(f"Result cache disk tier disabled: {str(e)}")
+            self._disk = None
+            return
+        self._purge_disk(time.time())
+
+    def _purge_disk(self, now):
+        """Delete expired rows, then the soonest-expiring rows beyond disk_max_entries"""
+        try:
+            self._disk.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+            self._disk.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,)
+            )
+            self._disk.commit()
+        except sqlite3.Error as e:
+            print(f"Result cache purge error: {str(e)}")
+
+    def make_key(self, *parts):
+        """Key for the given content parts under this cache's model version"""
+        return content_hash("\x1f".join([self.name, self.version] + [str(part) for part in parts]))
+
+    def _memory_get(self, key, now):
+        """(True, value) on a live in-process entry, else (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+        return False, None
+
+    def _disk_get(self, key, now):
+        """Value from the disk tier (remembered in memory), or None"""
+        with self._disk_lock:
+            try:
+                row = self._disk.execute(
+                    "SELECT expires_at, value FROM results WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Result cache read error: {str(e)}")
+                row = None
+        if row is None or row[0] <= now:
+            return None
+        value = json.loads(row[1])
+        with self._lock:
+            self._remember(key, row[0], value)
+            self.disk_hits += 1
+        return value
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        now = time.time()
+        found, value = self._memory_get(key, now)
+        if found:
+            return value
+        if self._disk is not None:
+            value = self._disk_get(key, now)
+            if value is not None:
+                return value
+        self._miss()
+        return None
+
+    async def get_async(self, key):
+        """get() for event-loop callers: the disk tier is read in a thread"""
+        now = time.time()
+        found, value = self._memory_get(key, now)
+        if found:
+            return value
+        if self._disk is not None:
+            value = await asyncio.to_thread(self._disk_get, key, now)
+            if value is not None:
+                return value
+        self._miss()
+        return None
+
+    def _disk_set(self, key, expires_at, value, now):
+        with self._disk_lock:
+            try:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO results (key, expires_at, value) VALUES (?, ?, ?)",
+                    (key, expires_at, json.dumps(value))
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                print(f"Result cache write error: {str(e)}")
+            self._disk_writes += 1
+            if self._disk_writes % RESULT_CACHE_DISK_PURGE_EVERY == 0:
+                self._purge_disk(now)
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+        if self._disk is not None:
+            self._disk_set(key, expires_at, value, now)
+
+    async def set_async(self, key, value):
+        """set() for event-loop callers: the disk tier is written in a thread"""
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk_set, key, expires_at, value, now)
+
+    def _remember(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "diskHits": self.disk_hits,
+            "misses": self.misses,
+            "hitRate": (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+def cache_stats(names=None):
+    """Stats of the named (default: every) result cache in this process"""
+    return {cache.name: cache.stats() for cache in _caches if names is None or cache.name in names}
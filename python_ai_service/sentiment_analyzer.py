@@ -1,33 +1,90 @@
 
 import os
 import json
-import openai
-import spacy
+import asyncio
+import inspect
 import numpy as np
-from transformers import pipeline, AutoModelForSequenceClassification, AutoTokenizer
 from dotenv import load_dotenv
+from model_registry import registry
+from result_cache import ResultCache, normalize_text, content_hash
+from contextual_analyzer import analyze_context_async, CONTEXTUAL_ANALYZER
 
 # Load environment variables
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-# Load spaCy model
-try:
-    nlp = spacy.load("en_core_web_md")
-except:
-    # If not available, download it
-    import subprocess
-    subprocess.call(["python", "-m", "spacy", "download", "en_core_web_md"])
-    nlp = spacy.load("en_core_web_md")
-
-# Load pre-trained sentiment analysis model
+
+# Model identifiers
+SPACY_MODEL_NAME = "en_core_web_md"
 MODEL_NAME = "distilbert-base-uncased-finetuned-sst-2-english"
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
-sentiment_pipeline = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
+EMOTION_MODEL_NAME = "j-hartmann/emotion-english-distilroberta-base"
+
+# spaCy components each NLP output depends on. Stop-word, punctuation and
+# static vector lookups are lexical, so they need nothing past the tokenizer.
+SPACY_OUTPUT_COMPONENTS = {
+    "keywords": [],
+    "vectors": [],
+    "entities": ["tok2vec", "ner"],
+    "lemmas": ["tok2vec", "tagger", "attribute_ruler", "lemmatizer"]
+}
+SPACY_COMPONENTS = ["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer", "ner"]
+
+# NLP outputs the analysis actually uses; only their components are loaded
+NLP_OUTPUTS = [output.strip() for output in os.getenv("NLP_OUTPUTS", "keywords").split(",") if output.strip()]
+NLP_PIPE_BATCH_SIZE = int(os.getenv("NLP_PIPE_BATCH_SIZE", 64))
+
+# Inference backend for both text classifiers: "pytorch", "onnx" or "onnx-int8"
+TEXT_CLASSIFIER_BACKEND = os.getenv("TEXT_CLASSIFIER_BACKEND", "pytorch")
+
+# Models are loaded lazily through the registry so importing this module stays fast.
+# Heavy libraries are imported inside the loaders for the same reason.
+def _load_spacy():
+    import spacy
+    required = {component for output in NLP_OUTPUTS for component in SPACY_OUTPUT_COMPONENTS[output]}
+    try:
+        # Excluded components are never loaded, which saves both time and memory
+        return spacy.load(SPACY_MODEL_NAME,
+                          exclude=[component for component in SPACY_COMPONENTS if component not in required])
+    except OSError:
+        raise RuntimeError(
+            f"spaCy model '{SPACY_MODEL_NAME}' is not installed; "
+            f"run: python -m spacy download {SPACY_MODEL_NAME}"
+        )
+
+def _load_onnx_classifier(model_name):
+    from onnx_backend import load_onnx_classifier
+    return load_onnx_classifier(model_name, quantize=TEXT_CLASSIFIER_BACKEND == "onnx-int8")
 
-# Load emotion detection model
-emotion_classifier = pipeline("text-classification", model="j-hartmann/emotion-english-distilroberta-base")
+def _load_sentiment_pipeline():
+    # Load pre-trained sentiment analysis model
+    if TEXT_CLASSIFIER_BACKEND.startswith("onnx"):
+        return _load_onnx_classifier(MODEL_NAME)
+    from transformers import pipeline, AutoModelForSequenceClassification, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
+    return pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
+
+def _load_emotion_classifier():
+    # Load emotion detection model
+    if TEXT_CLASSIFIER_BACKEND.startswith("onnx"):
+        return _load_onnx_classifier(EMOTION_MODEL_NAME)
+    from transformers import pipeline
+    return pipeline("text-classification", model=EMOTION_MODEL_NAME)
+
+registry.register("spacy", _load_spacy)
+registry.register("sentiment", _load_sentiment_pipeline)
+registry.register("emotion", _load_emotion_classifier)
+
+def warmup_models():
+    """Load every analysis model in this process and return registry stats"""
+    # Registers the local speech model when that transcription backend is configured
+    import transcriber  # noqa: F401
+    return registry.warmup()
+
+def model_stats():
+    """Registry stats for this process, without loading anything"""
+    return registry.stats()
+
+# Texts per padded forward pass when classifying many texts at once
+TEXT_BATCH_BUCKET_SIZE = int(os.getenv("TEXT_BATCH_BUCKET_SIZE", 8))
 
 # Define mood labels and their associated emotions
 MOOD_MAPPINGS = {
@@ -101,184 +158,344 @@ INDIAN_CULTURAL_CONTEXT = {
     ]
 }
 
-def analyze_sentiment(transcription, audio_features=None):
+def classify_texts(texts):
+    """
+    Run the sentiment and emotion models over many texts in padded batches
+    
+    Texts are sorted by length and split into buckets of TEXT_BATCH_BUCKET_SIZE,
+    so each forward pass only pads up to the longest text in its own bucket.
+    
+    Parameters:
+    texts (list): Texts to classify
+    
+    Returns:
+    list: (sentiment_result, emotion_result) tuple per text, in input order
+    """
+    if not texts:
+        return []
+    
+    # Character length is a cheap stand-in for token length when bucketing
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    sorted_texts = [texts[i] for i in order]
+    
+    sentiment_pipeline = registry.get("sentiment")
+    emotion_classifier = registry.get("emotion")
+    
+    sentiments = sentiment_pipeline(sorted_texts, batch_size=TEXT_BATCH_BUCKET_SIZE, truncation=True)
+    emotions = emotion_classifier(sorted_texts, batch_size=TEXT_BATCH_BUCKET_SIZE, truncation=True)
+    
+    results = [None] * len(texts)
+    for position, index in enumerate(order):
+        results[index] = (sentiments[position], emotions[position])
+    return results
+
+# Acronyms that collide with common words ("IT" vs "it") only match in their exact case
+CASE_SENSITIVE_CULTURAL_TERMS = {"IT"}
+
+# Optional JSON file of extra lexicon terms: {"context_type": ["term", ...], ...}
+CULTURAL_LEXICON_PATH = os.getenv("CULTURAL_LEXICON_PATH")
+
+def _load_cultural_matcher():
+    from phrase_matcher import KeywordAutomaton
+    
+    lexicon = {context_type: list(terms) for context_type, terms in INDIAN_CULTURAL_CONTEXT.items()}
+    if CULTURAL_LEXICON_PATH:
+        with open(CULTURAL_LEXICON_PATH, encoding="utf-8") as lexicon_file:
+            for context_type, terms in json.load(lexicon_file).items():
+                known = set(lexicon.setdefault(context_type, []))
+                lexicon[context_type].extend(term for term in terms if term not in known)
+    
+    matcher = KeywordAutomaton()
+    for type_index, (context_type, terms) in enumerate(lexicon.items()):
+        for position, term in enumerate(terms):
+            matcher.add(term, (type_index, context_type, position),
+                        case_sensitive=term in CASE_SENSITIVE_CULTURAL_TERMS)
+    matcher.build()
+    return matcher
+
+registry.register("cultural_matcher", _load_cultural_matcher)
+
+def detect_cultural_context(transcription):
     """
-    Analyze sentiment from transcription and audio features using multiple models
+    Find Indian cultural context terms in a single scan of the text
     
     Parameters:
     transcription (str): Transcribed text
+    
+    Returns:
+    (float, dict): Cultural context score adjustment and detected terms per context type
+    """
+    # Collect each term once, keeping lexicon order for context types and terms
+    detected = {}
+    for _, _, term, (type_index, context_type, position) in registry.get("cultural_matcher").find(transcription):
+        detected.setdefault((type_index, context_type), {})[position] = term
+    
+    cultural_context_score = 0
+    cultural_factors = {}
+    for (_, context_type), terms in sorted(detected.items()):
+        cultural_factors[context_type] = [terms[position] for position in sorted(terms)]
+        
+        # Adjust score based on cultural context
+        if context_type == "spiritual_terms":
+            cultural_context_score += 0.1  # Spiritual practices often have positive effect
+        elif context_type == "social_pressure_terms":
+            cultural_context_score -= 0.1  # Social pressure often has negative effect
+    
+    return cultural_context_score, cultural_factors
+
+def extract_keywords(doc, limit=10):
+    """Content words of a spaCy doc, skipping stop words and punctuation"""
+    keywords = []
+    for token in doc:
+        if token.is_stop is False and token.is_punct is False:
+            keywords.append(token.text)
+            if len(keywords) == limit:
+                break
+    return keywords
+
+def parse_texts(texts):
+    """Run the lean spaCy pipeline over many texts with nlp.pipe"""
+    return list(registry.get("spacy").pipe(texts, batch_size=NLP_PIPE_BATCH_SIZE))
+
+def extract_text_keywords(transcription):
+    """Keywords of a single text, for running the spaCy stage on its own"""
+    return extract_keywords(registry.get("spacy")(transcription))
+
+def extract_texts_keywords(texts):
+    """Keywords of many texts from one parse_texts pass, for batch callers"""
+    return [extract_keywords(doc) for doc in parse_texts(texts)]
+
+# Identifies embed_texts output, for caches of embeddings
+TEXT_EMBEDDING_VERSION = f"{SPACY_MODEL_NAME}|mean-content-vectors"
+
+def embed_texts(texts):
+    """
+    Embed texts as the mean static word vector of their content words
+
+    Only the tokenizer and the vector table are used, so no pipeline
+    component runs. Stop words and punctuation are skipped unless a text
+    has nothing else.
+
+    Parameters:
+    texts (list): Texts to embed
+
+    Returns:
+    np.ndarray: float32 matrix with one L2-normalized row per text
+                (all zeros for a text without any known word)
+    """
+    nlp = registry.get("spacy")
+    vectors = nlp.vocab.vectors
+    table = np.asarray(vectors.data, dtype=np.float32)
+    matrix = np.zeros((len(texts), table.shape[1]), dtype=np.float32)
+
+    for row, doc in enumerate(nlp.tokenizer.pipe(texts, batch_size=NLP_PIPE_BATCH_SIZE)):
+        tokens = [token for token in doc if not token.is_stop and not token.is_punct] or list(doc)
+        if not tokens:
+            continue
+        rows = vectors.find(keys=[token.orth for token in tokens])
+        # Fall back to the lowercase form for words missing in their original case
+        missing = rows < 0
+        if missing.any():
+            rows[missing] = vectors.find(keys=[token.lower for token, absent in zip(tokens, missing) if absent])
+        rows = rows[rows >= 0]
+        if len(rows):
+            matrix[row] = table[rows].mean(axis=0)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+# Everything the text-stage outputs depend on; a change here misses all old entries
+ANALYSIS_VERSION = "|".join([
+    MODEL_NAME, EMOTION_MODEL_NAME, TEXT_CLASSIFIER_BACKEND, SPACY_MODEL_NAME,
+    ",".join(NLP_OUTPUTS), CULTURAL_LEXICON_PATH or "", CONTEXTUAL_ANALYZER
+])
+
+# Outputs of the expensive text stages, keyed by the normalized transcription.
+# Audio features only enter at combine_analysis, so they are not part of the key.
+sentiment_cache = ResultCache("sentiment", ANALYSIS_VERSION)
+
+def _text_stages_key(transcription):
+    return sentiment_cache.make_key(content_hash(normalize_text(transcription)))
+
+async def _store_text_stages(key, model_outputs, keywords, cultural_context, context_analysis):
+    stages = {
+        "model_outputs": list(model_outputs),
+        "keywords": keywords,
+        "cultural_context": list(cultural_context),
+        "context_analysis": context_analysis
+    }
+    if not context_analysis.get("fallback"):
+        await sentiment_cache.set_async(key, stages)
+    return stages
+
+def _combine_cached(stages, audio_features):
+    return combine_analysis(stages["model_outputs"], stages["keywords"], stages["cultural_context"],
+                            stages["context_analysis"], audio_features)
+
+def _default_analysis():
+    return {
+        "score": 0,
+        "label": "neutral",
+        "emotions": {"neutral": 1.0},
+        "keywords": [],
+        "cultural_context": {},
+        "severity": "normal"
+    }
+
+def combine_analysis(model_outputs, keywords, cultural_context, context_analysis, audio_features=None):
+    """
+    Combine the outputs of the independent analysis stages into the final result
+    
+    Parameters:
+    model_outputs (tuple): classify_texts result (sentiment_result, emotion_result)
+    keywords (list): extract_keywords result
+    cultural_context (tuple): detect_cultural_context result (score, factors)
+    context_analysis (dict): contextual_analyzer.analyze_context result
     audio_features (dict): Audio features extracted from audio
     
     Returns:
     dict: Sentiment analysis including score, label, emotions
     """
-    try:
-        # 1. Use pre-trained model for basic sentiment
-        sentiment_result = sentiment_pipeline(transcription)[0]
-        base_score = sentiment_result["score"]
-        
-        # Convert to a scale from -1 to 1 where NEGATIVE = -1, POSITIVE = 1
-        if sentiment_result["label"] == "POSITIVE":
-            base_sentiment_score = base_score
-        else:
-            base_sentiment_score = -base_score
-        
-        # 2. Use emotion classifier
-        emotion_result = emotion_classifier(transcription)[0]
-        emotion_name = emotion_result["label"]
-        emotion_confidence = emotion_result["score"]
-        
-        # 3. Process with spaCy for additional features
-        doc = nlp(transcription)
-        
-        # Extract keywords and entities
-        keywords = []
-        for token in doc:
-            if token.is_stop is False and token.is_punct is False:
-                keywords.append(token.text)
-        
-        entities = [(ent.text, ent.label_) for ent in doc.ents]
+    sentiment_result, emotion_result = model_outputs
+    cultural_context_score, cultural_factors = cultural_context
+    
+    # 1. Use pre-trained model for basic sentiment
+    base_score = sentiment_result["score"]
+    
+    # Convert to a scale from -1 to 1 where NEGATIVE = -1, POSITIVE = 1
+    if sentiment_result["label"] == "POSITIVE":
+        base_sentiment_score = base_score
+    else:
+        base_sentiment_score = -base_score
+    
+    # 2. Use emotion classifier
+    emotion_name = emotion_result["label"]
+    emotion_confidence = emotion_result["score"]
+    
+    # 5. Contextual analysis (GPT-4 or the local backend)
+    context_adjustment = context_analysis["sentiment_score_adjustment"]
+    context_emotions = context_analysis["detected_emotions"]
+    severity = context_analysis["severity_level"]
+    
+    # 6. Incorporate audio features if available
+    audio_adjustment = 0
+    if audio_features:
+        # Use rms (energy) and tempo for emotional intensity
+        rms_mean = np.mean(audio_features.get("rms", [0]))
+        tempo = audio_features.get("tempo", 0)
         
-        # 4. Check for Indian cultural context indicators
-        cultural_context_score = 0
-        cultural_factors = {}
+        # Higher energy and tempo often correlate with arousal level
+        intensity = (rms_mean * 5) + (tempo / 200)
         
-        for context_type, terms in INDIAN_CULTURAL_CONTEXT.items():
-            detected_terms = []
-            for term in terms:
-                if term.lower() in transcription.lower():
-                    detected_terms.append(term)
-                    
-            if detected_terms:
-                cultural_factors[context_type] = detected_terms
-                
-                # Adjust score based on cultural context
-                if context_type == "spiritual_terms":
-                    cultural_context_score += 0.1  # Spiritual practices often have positive effect
-                elif context_type == "social_pressure_terms":
-                    cultural_context_score -= 0.1  # Social pressure often has negative effect
+        # Adjust based on audio features
+        if base_sentiment_score > 0:
+            audio_adjustment = min(intensity * 0.2, 0.2)  # Amplify positive emotions
+        elif base_sentiment_score < 0:
+            audio_adjustment = max(-intensity * 0.2, -0.2)  # Amplify negative emotions
+    
+    # 7. Combine all scores with weights
+    final_score = (
+        base_sentiment_score * 0.5 +    # Base sentiment model
+        context_adjustment * 0.3 +      # Contextual analysis adjustment
+        cultural_context_score * 0.1 +  # Cultural context adjustment
+        audio_adjustment * 0.1          # Audio-based adjustment
+    )
+    
+    # Ensure score is between -1 and 1
+    final_score = max(min(final_score, 1.0), -1.0)
+    
+    # Combine emotions from multiple sources
+    emotions = {}
+    
+    # Add emotions from emotion classifier
+    emotions[emotion_name] = emotion_confidence
+    
+    # Add emotions from the contextual analysis
+    for emotion, score in context_emotions.items():
+        if emotion in emotions:
+            emotions[emotion] = (emotions[emotion] + score) / 2  # Average if emotion exists
+        else:
+            emotions[emotion] = score
+    
+    # Determine sentiment label
+    if final_score >= 0.6:
+        sentiment_label = "positive"
+    elif final_score <= -0.3:
+        sentiment_label = "negative"
+    else:
+        sentiment_label = "neutral"
         
-        # 5. Use OpenAI for deep contextual analysis
-        try:
-            openai_response = openai.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are an expert in mental health analysis for Indian individuals. 
-                        Analyze the sentiment and emotional state from this text, considering Indian cultural context.
-                        Consider family dynamics, social pressures, spiritual practices, and work culture in India.
-                        
-                        Return ONLY a JSON object with the following structure:
-                        {
-                          "context_analysis": "Brief analysis of the person's emotional state",
-                          "sentiment_score_adjustment": Value between -0.3 and 0.3 to adjust the sentiment score,
-                          "detected_emotions": {
-                            "emotion1": probability from 0 to 1,
-                            "emotion2": probability from 0 to 1,
-                            ...
-                          },
-                          "cultural_factors": ["List of identified cultural factors affecting mood"],
-                          "severity_level": "normal" or "concerning" or "urgent"
-                        }"""
-                    },
-                    {
-                        "role": "user",
-                        "content": transcription
-                    }
-                ],
-                response_format={"type": "json_object"}
-            )
-            
-            openai_analysis = json.loads(openai_response.choices[0].message.content)
-            openai_adjustment = openai_analysis.get("sentiment_score_adjustment", 0)
-            openai_emotions = openai_analysis.get("detected_emotions", {})
-            severity = openai_analysis.get("severity_level", "normal")
-            
-        except Exception as e:
-            print(f"OpenAI analysis error: {str(e)}")
-            openai_adjustment = 0
-            openai_emotions = {}
-            severity = "normal"
+    # Create final result
+    return {
+        "score": final_score,
+        "label": sentiment_label,
+        "emotions": emotions,
+        "keywords": keywords,  # Top 10 keywords
+        "cultural_context": cultural_factors,
+        "severity": severity
+    }
+
+async def _resolve(value):
+    return await value if inspect.isawaitable(value) else value
+
+async def analyze_sentiment_async(transcription, audio_features=None, classify=None, run_in_executor=None,
+                                  keywords=None):
+    """
+    Analyze sentiment with the independent stages running concurrently
+    
+    The classifiers, the spaCy pass, the contextual analysis and any pending audio
+    feature extraction do not depend on each other, so they are started
+    together and only joined at the weighted combination; latency is roughly
+    that of the slowest stage.
+    
+    Parameters:
+    transcription (str): Transcribed text
+    audio_features (dict or awaitable): Audio features, or a pending task still computing them
+    classify (callable): Async text -> classify_texts result, e.g. a micro-batcher's submit
+    run_in_executor (callable): Async (fn, *args) -> result for blocking local stages
+    keywords (callable): Async text -> keyword list, e.g. a lookup into a batch's shared nlp.pipe pass
+    
+    Returns:
+    dict: Sentiment analysis including score, label, emotions
+    """
+    if run_in_executor is None:
+        run_in_executor = asyncio.to_thread
+    if classify is None:
+        async def classify(text):
+            return (await run_in_executor(classify_texts, [text]))[0]
+    if keywords is None:
+        async def keywords(text):
+            return await run_in_executor(extract_text_keywords, text)
+    
+    try:
+        cache_key = _text_stages_key(transcription)
+        stages = await sentiment_cache.get_async(cache_key)
+        if stages is not None:
+            return _combine_cached(stages, await _resolve(audio_features))
         
-        # 6. Incorporate audio features if available
-        audio_adjustment = 0
-        if audio_features:
-            # Use rms (energy) and tempo for emotional intensity
-            rms_mean = np.mean(audio_features.get("rms", [0]))
-            tempo = audio_features.get("tempo", 0)
-            
-            # Higher energy and tempo often correlate with arousal level
-            intensity = (rms_mean * 5) + (tempo / 200)
-            
-            # Adjust based on audio features
-            if base_sentiment_score > 0:
-                audio_adjustment = min(intensity * 0.2, 0.2)  # Amplify positive emotions
-            elif base_sentiment_score < 0:
-                audio_adjustment = max(-intensity * 0.2, -0.2)  # Amplify negative emotions
+        # The automaton scan is a single pass over the text; not worth a hop to an executor
+        cultural_context = detect_cultural_context(transcription)
         
-        # 7. Combine all scores with weights
-        final_score = (
-            base_sentiment_score * 0.5 +    # Base sentiment model
-            openai_adjustment * 0.3 +       # OpenAI contextual adjustment
-            cultural_context_score * 0.1 +  # Cultural context adjustment
-            audio_adjustment * 0.1          # Audio-based adjustment
+        model_outputs, text_keywords, context_analysis, audio_features = await asyncio.gather(
+            classify(transcription),
+            keywords(transcription),
+            analyze_context_async(transcription, cultural_context[1]),
+            _resolve(audio_features)
         )
-        
-        # Ensure score is between -1 and 1
-        final_score = max(min(final_score, 1.0), -1.0)
-        
-        # Combine emotions from multiple sources
-        emotions = {}
-        
-        # Add emotions from emotion classifier
-        emotions[emotion_name] = emotion_confidence
-        
-        # Add emotions from OpenAI analysis
-        for emotion, score in openai_emotions.items():
-            if emotion in emotions:
-                emotions[emotion] = (emotions[emotion] + score) / 2  # Average if emotion exists
-            else:
-                emotions[emotion] = score
-        
-        # Determine sentiment label
-        if final_score >= 0.6:
-            sentiment_label = "positive"
-        elif final_score <= -0.3:
-            sentiment_label = "negative"
-        else:
-            sentiment_label = "neutral"
-            
-        # Create final result
-        result = {
-            "score": final_score,
-            "label": sentiment_label,
-            "emotions": emotions,
-            "keywords": keywords[:10],  # Top 10 keywords
-            "cultural_context": cultural_factors,
-            "severity": severity
-        }
-        
-        return result
-        
+        stages = await _store_text_stages(cache_key, model_outputs, text_keywords, cultural_context, context_analysis)
+        return _combine_cached(stages, audio_features)
     except Exception as e:
         print(f"Error in sentiment analysis: {str(e)}")
         # Return default analysis if error occurs
-        return {
-            "score": 0,
-            "label": "neutral",
-            "emotions": {"neutral": 1.0},
-            "keywords": [],
-            "cultural_context": {},
-            "severity": "normal"
-        }
+        return _default_analysis()
 
 def get_mood_label_and_score(sentiment_analysis):
     """
     Convert sentiment analysis to mood label and score for the app
     
     Parameters:
-    sentiment_analysis (dict): Result from analyze_sentiment function
+    sentiment_analysis (dict): Result from analyze_sentiment_async
     
     Returns:
     (str, int): Mood label and score (1-10)
@@ -317,3 +534,75 @@ def get_mood_label_and_score(sentiment_analysis):
     mood_score = max(min(mood_score, mood_range[1]), mood_range[0])
     
     return best_mood, mood_score
+
+def sentiment_results_to_columns(sentiment_analyses):
+    """
+    Turn analyze_sentiment_async results into the columnar input of get_mood_labels_and_scores_batch
+    
+    Parameters:
+    sentiment_analyses (list): Results from analyze_sentiment_async
+    
+    Returns:
+    (np.ndarray, dict): Sentiment scores, and emotion name -> probabilities (NaN where absent)
+    """
+    scores = np.array([analysis.get("score", 0) for analysis in sentiment_analyses], dtype=np.float64)
+    emotions = {}
+    for row, analysis in enumerate(sentiment_analyses):
+        for emotion, probability in analysis.get("emotions", {}).items():
+            if emotion not in emotions:
+                emotions[emotion] = np.full(len(sentiment_analyses), np.nan)
+            emotions[emotion][row] = probability
+    return scores, emotions
+
+def get_mood_labels_and_scores_batch(scores, emotions, mood_mappings=None):
+    """
+    Vectorized get_mood_label_and_score for many stored results at once
+    
+    Evaluates the moods in the same order and with the same floating-point
+    operations as the scalar function, so labels and scores match it exactly
+    (ties go to the earlier mood).
+    
+    Parameters:
+    scores (array-like): Sentiment scores (-1 to 1), one per row
+    emotions (mapping): Emotion name -> per-row probabilities, e.g. a dict of arrays or a
+                        DataFrame; NaN means the emotion was absent from that row
+    mood_mappings (dict): Mood definitions to score against, defaults to MOOD_MAPPINGS
+    
+    Returns:
+    (np.ndarray, np.ndarray): Mood labels and integer mood scores (1-10)
+    """
+    mood_mappings = mood_mappings or MOOD_MAPPINGS
+    moods = list(mood_mappings)
+    scores = np.asarray(scores, dtype=np.float64)
+    
+    columns = {}
+    for mood_data in mood_mappings.values():
+        for emotion in mood_data["emotions"]:
+            if emotion not in columns and emotion in emotions:
+                # Absent emotions add nothing, as in the scalar loop
+                columns[emotion] = np.nan_to_num(np.asarray(emotions[emotion], dtype=np.float64), nan=0.0)
+    
+    # Best match so far per row; strict comparison keeps the first maximum
+    best_match = np.full(len(scores), -np.inf)
+    best_index = np.full(len(scores), moods.index("neutral") if "neutral" in moods else 0)
+    
+    for index, mood_data in enumerate(mood_mappings.values()):
+        range_mid = (mood_data["min_score"] + (mood_data["min_score"] + 0.2)) / 2
+        proximity_score = 1 - np.abs(scores - range_mid)
+        
+        emotion_match_score = np.zeros(len(scores))
+        for emotion in mood_data["emotions"]:
+            if emotion in columns:
+                emotion_match_score = emotion_match_score + columns[emotion]
+        
+        match_score = (emotion_match_score * 0.7) + (proximity_score * 0.3)
+        better = match_score > best_match
+        best_match = np.where(better, match_score, best_match)
+        best_index = np.where(better, index, best_index)
+    
+    mood_scores = np.trunc(((scores + 1) / 2) * 9).astype(np.int64) + 1
+    
+    score_ranges = np.array([mood_data["score_range"] for mood_data in mood_mappings.values()])
+    mood_scores = np.maximum(np.minimum(mood_scores, score_ranges[best_index, 1]), score_ranges[best_index, 0])
+    
+    return np.array(moods, dtype=object)[best_index], mood_scores
@@ -0,0 +1,309 @@
+import os
+import librosa
+import numpy as np
+import soxr
+from dotenv import load_dotenv
+from audio_processor import (
+    TARGET_SAMPLE_RATE, N_FFT, HOP_LENGTH, FEATURE_EXTRACTORS,
+    SharedSpectrogram, DecodedAudio, get_feature_profile
+)
+from transcriber import chunk_boundaries
+from vad import VAD_ENABLED, StreamSpeechStats
+
+# Load environment variables
+load_dotenv()
+
+# Sample rate assumed when the client does not send a start message
+STREAM_DEFAULT_SAMPLE_RATE = int(os.getenv("STREAM_DEFAULT_SAMPLE_RATE", 16000))
+# STFT frames processed together (64 frames is about 1.5 s at 22.05 kHz)
+STREAM_BLOCK_FRAMES = int(os.getenv("STREAM_BLOCK_FRAMES", 64))
+# Speech is closed into chunks of about this length for partial transcription
+STREAM_CHUNK_SECONDS = float(os.getenv("STREAM_CHUNK_SECONDS", 10))
+# Streams longer than this are rejected
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", 600))
+
+# Raw PCM encodings accepted in binary frames
+PCM_ENCODINGS = {
+    "pcm_s16le": np.dtype("<i2"),
+    "pcm_f32le": np.dtype("<f4")
+}
+
+# power_to_db's default dynamic range, applied once over the whole stream
+MEL_TOP_DB = 80.0
+
+class StreamTooLongError(Exception):
+    """Raised when a stream goes past STREAM_MAX_SECONDS"""
+
+class PcmDecoder:
+    """Turns binary PCM frames into mono float32 samples, carrying partial sample frames over"""
+
+    def __init__(self, encoding="pcm_s16le", channels=1):
+        if encoding not in PCM_ENCODINGS:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        if channels < 1:
+            raise ValueError("channels must be at least 1")
+        self.dtype = PCM_ENCODINGS[encoding]
+        self.channels = channels
+        self._frame_bytes = self.dtype.itemsize * channels
+        self._remainder = b""
+
+    def decode(self, data):
+        data = self._remainder + data
+        usable = len(data) - len(data) % self._frame_bytes
+        self._remainder = data[usable:]
+
+        samples = np.frombuffer(data[:usable], dtype=self.dtype).astype(np.float32)
+        if self.dtype.kind == "i":
+            samples /= 32768.0
+        if self.channels > 1:
+            # Down-mix to mono the same way decode_audio does
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return samples
+
+class StreamingFeatureAccumulator:
+    """
+    Audio features updated block by block while the audio is still arriving
+
+    The stream is framed exactly like librosa's centered STFT on the whole
+    clip, so frame-wise features (mel, MFCCs, spectral contrast, RMS, ZCR)
+    and the tempo come out the same as process_audio would compute them.
+    Chroma estimates tuning per block and tonnetz is computed per closed
+    chunk, so those two closely approximate the whole-clip values.
+    Only the final aggregation is left when the stream ends, using the
+    extractors of the feature profile.
+    """
+
+    def __init__(self, sr=TARGET_SAMPLE_RATE, features=None, profile=None, n_fft=N_FFT, hop_length=HOP_LENGTH,
+                 block_frames=STREAM_BLOCK_FRAMES):
+        # Every feature of the profile (the deployment's by default) unless a subset is given
+        self.extractors = get_feature_profile(profile)
+        self.features = list(features or self.extractors)
+        unknown = [name for name in self.features if name not in self.extractors]
+        if unknown:
+            raise ValueError(f"Unknown audio features: {', '.join(unknown)}")
+
+        # Keep per-block mel dB frames only for extractors that read the mel spectrogram;
+        # the full tempo tracks beats on it, the fast one reads the frame RMS instead
+        full_tempo = "tempo" in self.features and self.extractors["tempo"] is FEATURE_EXTRACTORS["tempo"]
+        self._keep_mel = full_tempo or "mfccs" in self.features or "mel" in self.features
+        self._keep_rms = "tempo" in self.features and not full_tempo
+
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.block_frames = block_frames
+        self.frames = 0
+
+        # Pending samples, padded the way the whole-clip features pad them:
+        # zeros for the STFT and RMS, repeated edge samples for ZCR
+        self._padded = np.zeros(n_fft // 2, dtype=np.float32)
+        self._edge_padded = None
+
+        self._sums = {}
+        # Mel dB frames before the clip-wide top_db floor, for mel, MFCCs and the full tempo
+        self._mel_db_blocks = []
+        # RMS frames for the fast tempo
+        self._rms_blocks = []
+        self._tonnetz_sum = None
+        self._tonnetz_frames = 0
+
+    def add_samples(self, samples):
+        """Append samples at self.sr and process every complete block"""
+        if not len(samples):
+            return
+        if self._edge_padded is None:
+            self._edge_padded = np.full(self.n_fft // 2, samples[0], dtype=np.float32)
+        self._padded = np.concatenate([self._padded, samples])
+        self._edge_padded = np.concatenate([self._edge_padded, samples])
+        self._process(self.block_frames)
+
+    def add_chunk(self, samples):
+        """Fold a closed chunk into the per-chunk features (tonnetz)"""
+        if "tonnetz" not in self.features or not len(samples):
+            return
+        harmonic = SharedSpectrogram(samples, self.sr, self.n_fft, self.hop_length).harmonic
+        tonnetz = librosa.feature.tonnetz(y=harmonic, sr=self.sr)
+        chunk_sum = tonnetz.sum(axis=1)
+        self._tonnetz_sum = chunk_sum if self._tonnetz_sum is None else self._tonnetz_sum + chunk_sum
+        self._tonnetz_frames += tonnetz.shape[1]
+
+    def _process(self, min_frames):
+        available = 0
+        if len(self._padded) >= self.n_fft:
+            available = 1 + (len(self._padded) - self.n_fft) // self.hop_length
+        if not available or available < min_frames:
+            return
+
+        span = self.n_fft + (available - 1) * self.hop_length
+        self._update(self._padded[:span], self._edge_padded[:span])
+
+        consumed = available * self.hop_length
+        self._padded = self._padded[consumed:]
+        self._edge_padded = self._edge_padded[consumed:]
+        self.frames += available
+
+    def _add(self, name, frame_values):
+        block_sum = frame_values.sum(axis=1)
+        self._sums[name] = block_sum if name not in self._sums else self._sums[name] + block_sum
+
+    def _update(self, block, edge_block):
+        spec = SharedSpectrogram(block, self.sr, self.n_fft, self.hop_length, center=False)
+        features = self.features
+
+        if self._keep_mel:
+            self._mel_db_blocks.append(librosa.power_to_db(spec.mel_power, top_db=None))
+        if "chroma" in features:
+            self._add("chroma", librosa.feature.chroma_stft(S=spec.power, sr=self.sr, n_fft=self.n_fft,
+                                                           hop_length=self.hop_length))
+        if "contrast" in features:
+            self._add("contrast", librosa.feature.spectral_contrast(S=spec.magnitude, sr=self.sr,
+                                                                   n_fft=self.n_fft,
+                                                                   hop_length=self.hop_length))
+        if "rms" in features or self._keep_rms:
+            rms = librosa.feature.rms(y=block, frame_length=self.n_fft, hop_length=self.hop_length, center=False)
+            if "rms" in features:
+                self._add("rms", rms)
+            if self._keep_rms:
+                self._rms_blocks.append(rms)
+        if "zcr" in features:
+            self._add("zcr", librosa.feature.zero_crossing_rate(edge_block, frame_length=self.n_fft,
+                                                                hop_length=self.hop_length, center=False))
+
+    def finalize(self):
+        """
+        Flush the remaining frames and aggregate
+
+        Returns:
+        dict: Feature name -> mean value over frames, like process_audio
+        """
+        if self._edge_padded is None:
+            raise ValueError("No audio received")
+
+        # Close the stream with the same end padding as the whole-clip features
+        self._padded = np.concatenate([self._padded, np.zeros(self.n_fft // 2, dtype=np.float32)])
+        self._edge_padded = np.concatenate([
+            self._edge_padded, np.full(self.n_fft // 2, self._edge_padded[-1], dtype=np.float32)
+        ])
+        self._process(1)
+
+        result = {}
+        if self._mel_db_blocks or self._rms_blocks:
+            # Reuse the profile's whole-clip extractors on the assembled frames
+            spec = SharedSpectrogram(None, self.sr, self.n_fft, self.hop_length)
+            if self._mel_db_blocks:
+                mel_db = np.concatenate(self._mel_db_blocks, axis=1)
+                spec.mel_db = np.maximum(mel_db, mel_db.max() - MEL_TOP_DB)
+            if self._rms_blocks:
+                spec.frame_rms = np.concatenate(self._rms_blocks, axis=1)
+            for name in ("mfccs", "mel", "tempo"):
+                if name in self.features:
+                    result[name] = self.extractors[name](spec)
+        for name, total in self._sums.items():
+            result[name] = (total / self.frames).tolist()
+        if "tonnetz" in self.features and self._tonnetz_frames:
+            result["tonnetz"] = (self._tonnetz_sum / self._tonnetz_frames).tolist()
+
+        return {name: result[name] for name in self.features if name in result}
+
+class AudioStream:
+    """
+    One live recording: decodes PCM frames, resamples them as they arrive,
+    updates the features and closes chunks for partial transcription
+
+    With VAD enabled, each closed chunk is trimmed to its speech like an
+    upload is (a chunk without detected speech is kept whole), and only the
+    speech reaches the features, so they are updated chunk by chunk instead
+    of as frames arrive. Speech ratio and pause statistics cover the whole
+    stream.
+
+    Not thread-safe; feed a stream from one task at a time.
+    """
+
+    def __init__(self, sample_rate=STREAM_DEFAULT_SAMPLE_RATE, encoding="pcm_s16le", channels=1,
+                 features=None, profile=None, chunk_seconds=STREAM_CHUNK_SECONDS, max_seconds=STREAM_MAX_SECONDS,
+                 vad=VAD_ENABLED):
+        self.decoder = PcmDecoder(encoding, channels)
+        self.sr = TARGET_SAMPLE_RATE
+        self.resampler = None
+        if sample_rate != self.sr:
+            self.resampler = soxr.ResampleStream(sample_rate, self.sr, 1, dtype="float32", quality="HQ")
+        self.accumulator = StreamingFeatureAccumulator(self.sr, features, profile)
+        self.speech = StreamSpeechStats(self.sr) if vad else None
+        self.chunk_seconds = chunk_seconds
+        self.max_samples = int(max_seconds * self.sr)
+        self.samples_received = 0
+        self._chunk = []
+        self._chunk_length = 0
+
+    @property
+    def duration(self):
+        return self.samples_received / float(self.sr)
+
+    def _add(self, samples):
+        if not len(samples):
+            return
+        self.samples_received += len(samples)
+        if self.samples_received > self.max_samples:
+            raise StreamTooLongError(f"Streams are limited to {self.max_samples // self.sr} seconds")
+        if self.speech is None:
+            self.accumulator.add_samples(samples)
+        self._chunk.append(samples)
+        self._chunk_length += len(samples)
+
+    def _close_chunks(self, final=False):
+        if not self._chunk_length:
+            return []
+        if not final and self._chunk_length <= self.chunk_seconds * self.sr:
+            return []
+
+        pending = np.concatenate(self._chunk)
+        boundaries = chunk_boundaries(pending, self.sr, self.chunk_seconds)
+        if not final:
+            # The last piece is still open
+            boundaries = boundaries[:-1]
+
+        closed = []
+        for start, end in boundaries:
+            chunk = DecodedAudio(pending[start:end], self.sr)
+            if self.speech is not None:
+                # The segments are cached on the chunk, so transcription reuses them
+                self.speech.add(chunk.speech)
+                voiced = chunk.voiced().samples
+                self.accumulator.add_samples(voiced)
+                self.accumulator.add_chunk(voiced)
+            else:
+                self.accumulator.add_chunk(chunk.samples)
+            closed.append(chunk)
+
+        rest = pending[boundaries[-1][1]:] if boundaries else pending
+        self._chunk = [rest] if len(rest) else []
+        self._chunk_length = len(rest)
+        return closed
+
+    def feed(self, data):
+        """
+        Add one binary PCM frame
+
+        Returns:
+        list: DecodedAudio chunks closed by this frame, ready for transcription
+        """
+        samples = self.decoder.decode(data)
+        if self.resampler is not None:
+            samples = self.resampler.resample_chunk(samples)
+        self._add(samples)
+        return self._close_chunks()
+
+    def finish(self):
+        """
+        End the stream
+
+        Returns:
+        tuple: (remaining DecodedAudio chunks, audio features dict)
+        """
+        if self.resampler is not None:
+            self._add(self.resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+        chunks = self._close_chunks(final=True)
+        features = self.accumulator.finalize()
+        if self.speech is not None:
+            features.update(self.speech.stats())
+        return chunks, features
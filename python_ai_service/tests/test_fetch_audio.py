@@ -0,0 +1,50 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import audio_processor
+from audio_processor import fetch_audio
+
+AUDIO_BYTES = b"RIFF" + bytes(range(256)) * 64
+
+class AudioHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/clip.wav":
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(AUDIO_BYTES)))
+        self.end_headers()
+        self.wfile.write(AUDIO_BYTES)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def audio_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AudioHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def test_fetch_audio_downloads_bytes(audio_server):
+    assert fetch_audio(f"{audio_server}/clip.wav") == AUDIO_BYTES
+
+def test_fetch_audio_raises_on_http_error(audio_server):
+    with pytest.raises(requests.HTTPError) as error:
+        fetch_audio(f"{audio_server}/missing.wav")
+    assert error.value.response.status_code == 404
+
+def test_fetch_audio_enforces_size_limit(audio_server, monkeypatch):
+    monkeypatch.setattr(audio_processor, "AUDIO_FETCH_MAX_BYTES", 1024)
+    with pytest.raises(ValueError, match="too large"):
+        fetch_audio(f"{audio_server}/clip.wav")
+
+def test_fetch_audio_rejects_non_http_urls():
+    with pytest.raises(ValueError, match="http"):
+        fetch_audio("file:///etc/passwd")
@@ -0,0 +1,186 @@
+import os
+import time
+import openai
+import numpy as np
+from dotenv import load_dotenv
+from model_registry import registry
+
+# Load environment variables
+load_dotenv()
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# Speech-to-text backend: "openai" (hosted whisper-1) or "local" (CTranslate2 Whisper on CPU)
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "openai")
+TRANSCRIPTION_LANGUAGE = os.getenv("TRANSCRIPTION_LANGUAGE", "en")
+
+# Local engine settings
+LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "base")
+LOCAL_WHISPER_COMPUTE_TYPE = os.getenv("LOCAL_WHISPER_COMPUTE_TYPE", "int8")
+LOCAL_WHISPER_BEAM_SIZE = int(os.getenv("LOCAL_WHISPER_BEAM_SIZE", 1))
+# Long recordings are decoded in chunks of about this many seconds
+LOCAL_WHISPER_CHUNK_SECONDS = float(os.getenv("LOCAL_WHISPER_CHUNK_SECONDS", 30))
+
+# Whisper models expect 16 kHz mono input
+WHISPER_SAMPLE_RATE = 16000
+# How far back from a chunk boundary to look for a quiet spot to cut at
+CHUNK_CUT_SEARCH_SECONDS = 2.0
+
+class TranscriptionError(Exception):
+    """Raised when a recording could not be transcribed"""
+
+class TranscriptionResult:
+    """Transcribed text plus timing, including the real-time factor"""
+
+    def __init__(self, text, audio_seconds, processing_seconds, backend):
+        self.text = text
+        self.audio_seconds = audio_seconds
+        self.processing_seconds = processing_seconds
+        self.backend = backend
+
+    @property
+    def real_time_factor(self):
+        """Processing time divided by audio duration; below 1.0 is faster than real time"""
+        if not self.audio_seconds:
+            return 0.0
+        return self.processing_seconds / self.audio_seconds
+
+def chunk_boundaries(samples, sr, chunk_seconds=LOCAL_WHISPER_CHUNK_SECONDS):
+    """
+    Split points for chunked decoding, moved to the quietest nearby frame
+
+    Parameters:
+    samples (np.ndarray): Mono audio samples
+    sr (int): Sample rate
+    chunk_seconds (float): Target chunk length
+
+    Returns:
+    list: (start, end) sample offsets covering the whole signal
+    """
+    chunk_length = int(chunk_seconds * sr)
+    search_length = int(CHUNK_CUT_SEARCH_SECONDS * sr)
+    frame_length = max(1, sr // 50)  # 20 ms
+
+    boundaries = []
+    start = 0
+    while len(samples) - start > chunk_length:
+        target = start + chunk_length
+        window = samples[target - search_length:target]
+        frames = len(window) // frame_length
+        if frames:
+            energy = np.square(window[:frames * frame_length]).reshape(frames, frame_length).mean(axis=1)
+            cut = target - search_length + int(np.argmin(energy)) * frame_length
+        else:
+            cut = target
+        # Never produce an empty chunk
+        cut = max(cut, start + 1)
+        boundaries.append((start, cut))
+        start = cut
+    boundaries.append((start, len(samples)))
+    return boundaries
+
+# Containers the hosted API accepts as uploaded; anything else is re-encoded as WAV
+OPENAI_UPLOAD_FORMATS = {"wav", "flac", "ogg", "mp3", "webm", "mp4"}
+
+class OpenAIWhisperTranscriber:
+    """Hosted whisper-1 transcription, uploading the audio from memory"""
+
+    name = "openai"
+    cpu_bound = False
+
+    def _upload(self, audio):
+        if audio.raw_bytes is not None and getattr(audio, "format", None) not in OPENAI_UPLOAD_FORMATS:
+            return ("audio.wav", audio.to_wav_bytes())
+        return audio.as_upload()
+
+    def transcribe(self, audio):
+        started = time.perf_counter()
+        try:
+            transcription = openai.audio.transcriptions.create(
+                model="whisper-1",
+                file=self._upload(audio),
+                language=TRANSCRIPTION_LANGUAGE
+            )
+        except Exception as e:
+            raise TranscriptionError(str(e))
+        return TranscriptionResult(transcription.text, audio.duration,
+                                   time.perf_counter() - started, self.name)
+
+def _load_local_whisper():
+    from faster_whisper import WhisperModel
+    return WhisperModel(
+        LOCAL_WHISPER_MODEL,
+        device="cpu",
+        compute_type=LOCAL_WHISPER_COMPUTE_TYPE,
+        cpu_threads=int(os.getenv("OMP_NUM_THREADS", 0))
+    )
+
+# Only deployments using the local backend load (and warm up) the speech model
+if TRANSCRIPTION_BACKEND == "local":
+    registry.register("whisper", _load_local_whisper)
+
+class LocalWhisperTranscriber:
+    """
+    Whisper-class transcription on the local CPU (CTranslate2, int8 by default)
+
+    Works directly on the decoded samples, with no upload and no temp files.
+    Long recordings are decoded chunk by chunk, cutting at quiet frames.
+    """
+
+    name = "local"
+    cpu_bound = True
+
+    def _prepare(self, audio):
+        samples = np.asarray(audio.samples, dtype=np.float32)
+        if audio.sr != WHISPER_SAMPLE_RATE:
+            import librosa
+            samples = librosa.resample(samples, orig_sr=audio.sr, target_sr=WHISPER_SAMPLE_RATE,
+                                       res_type="soxr_mq")
+        return samples
+
+    def transcribe_samples(self, samples):
+        """Transcribe one chunk of 16 kHz float32 samples"""
+        segments, _ = registry.get("whisper").transcribe(
+            samples,
+            language=TRANSCRIPTION_LANGUAGE,
+            beam_size=LOCAL_WHISPER_BEAM_SIZE
+        )
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    def transcribe_chunks(self, audio):
+        """Yield the text of each chunk as soon as it is decoded"""
+        samples = self._prepare(audio)
+        for start, end in chunk_boundaries(samples, WHISPER_SAMPLE_RATE):
+            text = self.transcribe_samples(samples[start:end])
+            if text:
+                yield text
+
+    def transcribe(self, audio):
+        started = time.perf_counter()
+        try:
+            text = " ".join(self.transcribe_chunks(audio))
+        except Exception as e:
+            raise TranscriptionError(str(e))
+        return TranscriptionResult(text, audio.duration, time.perf_counter() - started, self.name)
+
+TRANSCRIBERS = {
+    "openai": OpenAIWhisperTranscriber,
+    "local": LocalWhisperTranscriber
+}
+
+_transcribers = {}
+
+def get_transcriber(name=None):
+    """Shared transcriber instance for the given (or configured) backend name"""
+    name = name or TRANSCRIPTION_BACKEND
+    if name not in TRANSCRIBERS:
+        raise ValueError(f"Unknown transcription backend: {name}")
+    if name not in _transcribers:
+        _transcribers[name] = TRANSCRIBERS[name]()
+    return _transcribers[name]
+
+def transcription_version(name=None):
+    """Identifies the backend and model, so cached transcripts follow backend changes"""
+    name = name or TRANSCRIPTION_BACKEND
+    if name == "local":
+        return f"local|{LOCAL_WHISPER_MODEL}|{LOCAL_WHISPER_COMPUTE_TYPE}|{TRANSCRIPTION_LANGUAGE}"
+    return f"whisper-1|{TRANSCRIPTION_LANGUAGE}"
@@ -0,0 +1,169 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Trim silence before feature extraction and transcription
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"
+# Energy frame length
+VAD_FRAME_MS = float(os.getenv("VAD_FRAME_MS", 20))
+# Frames this far above the estimated noise floor count as speech
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", 12))
+# Frames quieter than this never count as speech
+VAD_MIN_DBFS = float(os.getenv("VAD_MIN_DBFS", -60))
+# Gaps shorter than this are bridged (hangover), speech bursts shorter than this are dropped
+VAD_MIN_PAUSE_MS = float(os.getenv("VAD_MIN_PAUSE_MS", 300))
+VAD_MIN_SPEECH_MS = float(os.getenv("VAD_MIN_SPEECH_MS", 100))
+# Context kept around every speech segment so word onsets and endings are not clipped
+VAD_PADDING_MS = float(os.getenv("VAD_PADDING_MS", 100))
+
+# Extra features reported next to the spectral ones
+SPEECH_FEATURE_NAMES = ["speech_ratio", "speech_seconds", "pause_count", "mean_pause", "max_pause"]
+
+def vad_version():
+    """Identifies the VAD settings, so cached results follow configuration changes"""
+    if not VAD_ENABLED:
+        return "vad-off"
+    return (f"vad|{VAD_FRAME_MS}|{VAD_THRESHOLD_DB}|{VAD_MIN_DBFS}|{VAD_MIN_PAUSE_MS}|"
+            f"{VAD_MIN_SPEECH_MS}|{VAD_PADDING_MS}")
+
+def _runs(mask):
+    """(start, end) index pairs of the True runs in a boolean array"""
+    edges = np.diff(np.concatenate([[False], mask, [False]]).astype(np.int8))
+    return list(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
+
+class SpeechSegments:
+    """Speech regions of one clip, as (start, end) sample offsets, plus the pauses between them"""
+
+    def __init__(self, segments, total_samples, sr, pauses=None):
+        self.segments = segments
+        self.total_samples = total_samples
+        self.sr = sr
+        # Pause lengths in samples, measured before segments were padded
+        self.pauses = pauses or []
+
+    @property
+    def speech_samples(self):
+        return sum(end - start for start, end in self.segments)
+
+    @property
+    def has_speech(self):
+        return bool(self.segments)
+
+    def voiced(self, samples):
+        """Only the speech regions of samples, joined together"""
+        if not self.segments:
+            return samples
+        if len(self.segments) == 1:
+            start, end = self.segments[0]
+            return samples[start:end]
+        return np.concatenate([samples[start:end] for start, end in self.segments])
+
+    def stats(self):
+        """
+        Speech ratio and pause statistics
+
+        Returns:
+        dict: speech_ratio, speech_seconds, pause_count, mean_pause and max_pause (seconds);
+              pauses are the gaps between speech segments, not leading or trailing silence
+        """
+        pauses = [pause / float(self.sr) for pause in self.pauses]
+        return {
+            "speech_ratio": self.speech_samples / float(self.total_samples) if self.total_samples else 0.0,
+            "speech_seconds": self.speech_samples / float(self.sr),
+            "pause_count": len(pauses),
+            "mean_pause": float(np.mean(pauses)) if pauses else 0.0,
+            "max_pause": max(pauses) if pauses else 0.0
+        }
+
+def detect_speech(samples, sr):
+    """
+    Energy-based voice activity detection
+
+    Frames are compared against an adaptive threshold above the clip's noise
+    floor; short gaps are bridged, short bursts dropped, and each segment
+    is padded a little.
+
+    Parameters:
+    samples (np.ndarray): Mono audio samples
+    sr (int): Sample rate
+
+    Returns:
+    SpeechSegments: Speech regions in sample offsets
+    """
+    frame_length = max(1, int(sr * VAD_FRAME_MS / 1000))
+    frames = len(samples) // frame_length
+    if not frames:
+        return SpeechSegments([], len(samples), sr)
+
+    energy = np.square(samples[:frames * frame_length].astype(np.float32)).reshape(frames, frame_length)
+    energy_db = 10 * np.log10(energy.mean(axis=1) + 1e-12)
+
+    # Quietest decile approximates the noise floor; cap the threshold below the
+    # peak so clips that are speech throughout are not trimmed away
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(min(noise_floor + VAD_THRESHOLD_DB, float(energy_db.max()) - 6), VAD_MIN_DBFS)
+    speech = energy_db > threshold
+
+    # Bridge short pauses between speech runs
+    min_pause = int(round(VAD_MIN_PAUSE_MS / VAD_FRAME_MS))
+    runs = _runs(speech)
+    for (_, end), (next_start, _) in zip(runs, runs[1:]):
+        if next_start - end < min_pause:
+            speech[end:next_start] = True
+
+    # Drop bursts too short to be speech (clicks, bumps)
+    min_speech = int(round(VAD_MIN_SPEECH_MS / VAD_FRAME_MS))
+    padding = int(round(VAD_PADDING_MS / VAD_FRAME_MS))
+    kept = [(start, end) for start, end in _runs(speech) if end - start >= min_speech]
+    pauses = [(next_start - end) * frame_length for (_, end), (next_start, _) in zip(kept, kept[1:])]
+    segments = []
+    for start, end in kept:
+        start = max(0, start - padding) * frame_length
+        end = min(frames, end + padding) * frame_length
+        if end == frames * frame_length:
+            # Keep the partial frame at the end of the clip
+            end = len(samples)
+        if segments and start <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((start, end))
+
+    return SpeechSegments(segments, len(samples), sr, pauses)
+
+class StreamSpeechStats:
+    """
+    Speech statistics over the consecutive closed chunks of one stream
+
+    Each chunk has its own SpeechSegments. Segments are shifted to stream
+    offsets, and a pause spanning a chunk boundary is measured between the
+    neighbouring segments with their padding taken off again, so it counts
+    the way it would inside a single clip.
+    """
+
+    def __init__(self, sr):
+        self.sr = sr
+        self.total_samples = 0
+        self.segments = []
+        self.pauses = []
+        self._padding = int(round(VAD_PADDING_MS / VAD_FRAME_MS)) * max(1, int(sr * VAD_FRAME_MS / 1000))
+        self._min_pause = int(sr * VAD_MIN_PAUSE_MS / 1000)
+
+    def add(self, speech):
+        """Append the SpeechSegments of the next chunk"""
+        offset = self.total_samples
+        if speech.segments:
+            first = offset + speech.segments[0][0]
+            if self.segments:
+                gap = first - self.segments[-1][1] + 2 * self._padding
+                if gap >= self._min_pause:
+                    self.pauses.append(gap)
+            self.pauses.extend(speech.pauses)
+            self.segments.extend((offset + start, offset + end) for start, end in speech.segments)
+        self.total_samples += speech.total_samples
+
+    def stats(self):
+        """Same statistics as SpeechSegments.stats, for the whole stream"""
+        return SpeechSegments(self.segments, self.total_samples, self.sr, self.pauses).stats()